@@ -298,6 +298,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         self._last_host_check = 0
         self._last_bw_usage_poll = 0
         self._last_info_cache_heal = 0
+        self._audit_ran_for_period = None
         self.compute_api = compute.API()
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
@@ -2761,51 +2762,67 @@ class ComputeManager(manager.SchedulerDependentManager):
                            "older than %(confirm_window)d seconds"),
                          migrations_info)
 
+            errored_ids = []
+
             def _set_migration_to_error(migration_id, reason, **kwargs):
                 msg = _("Setting migration %(migration_id)s to error: "
                        "%(reason)s") % locals()
                 LOG.warn(msg, **kwargs)
-                self.db.migration_update(context, migration_id,
-                                        {'status': 'error'})
-
-            for migration in migrations:
-                migration_id = migration['id']
-                instance_uuid = migration['instance_uuid']
-                LOG.info(_("Automatically confirming migration "
-                           "%(migration_id)s for instance %(instance_uuid)s"),
-                           locals())
-                try:
-                    instance = self.db.instance_get_by_uuid(context,
-                                                            instance_uuid)
-                except exception.InstanceNotFound:
-                    reason = _("Instance %(instance_uuid)s not found")
-                    _set_migration_to_error(migration_id, reason % locals())
-                    continue
-                if instance['vm_state'] == vm_states.ERROR:
-                    reason = _("In ERROR state")
-                    _set_migration_to_error(migration_id, reason % locals(),
-                                            instance=instance)
-                    continue
-                vm_state = instance['vm_state']
-                task_state = instance['task_state']
-                if vm_state != vm_states.RESIZED or task_state is not None:
-                    reason = _("In states %(vm_state)s/%(task_state)s, not"
-                            "RESIZED/None")
-                    _set_migration_to_error(migration_id, reason % locals(),
-                                            instance=instance)
-                    continue
-                try:
-                    self.compute_api.confirm_resize(context, instance)
-                except Exception, e:
-                    msg = _("Error auto-confirming resize: %(e)s. "
-                            "Will retry later.")
-                    LOG.error(msg % locals(), instance=instance)
+                errored_ids.append(migration_id)
+
+            # NOTE: write the errors collected so far even if something
+            # unexpected ends the loop early.
+            try:
+                for migration in migrations:
+                    migration_id = migration['id']
+                    instance_uuid = migration['instance_uuid']
+                    LOG.info(_("Automatically confirming migration "
+                               "%(migration_id)s for instance "
+                               "%(instance_uuid)s"), locals())
+                    try:
+                        instance = self.db.instance_get_by_uuid(context,
+                                                                instance_uuid)
+                    except exception.InstanceNotFound:
+                        reason = _("Instance %(instance_uuid)s not found")
+                        _set_migration_to_error(migration_id,
+                                                reason % locals())
+                        continue
+                    if instance['vm_state'] == vm_states.ERROR:
+                        reason = _("In ERROR state")
+                        _set_migration_to_error(migration_id,
+                                                reason % locals(),
+                                                instance=instance)
+                        continue
+                    vm_state = instance['vm_state']
+                    task_state = instance['task_state']
+                    if (vm_state != vm_states.RESIZED or
+                        task_state is not None):
+                        reason = _("In states %(vm_state)s/%(task_state)s, not"
+                                "RESIZED/None")
+                        _set_migration_to_error(migration_id,
+                                                reason % locals(),
+                                                instance=instance)
+                        continue
+                    try:
+                        self.compute_api.confirm_resize(context, instance)
+                    except Exception, e:
+                        msg = _("Error auto-confirming resize: %(e)s. "
+                                "Will retry later.")
+                        LOG.error(msg % locals(), instance=instance)
+            finally:
+                if errored_ids:
+                    self.db.migration_bulk_update(context, errored_ids,
+                                                  {'status': 'error'})
 
     @manager.periodic_task
     def _instance_usage_audit(self, context):
         if CONF.instance_usage_audit:
+            begin, end = utils.last_completed_audit_period()
+            # NOTE: the audit runs at most once per audit period, so skip
+            # the task log lookup once this period is known to be done.
+            if self._audit_ran_for_period == (begin, end):
+                return
             if not compute_utils.has_audit_been_run(context, self.host):
-                begin, end = utils.last_completed_audit_period()
                 instances = self.db.instance_get_active_by_window_joined(
                                                             context,
                                                             begin,
@@ -2846,6 +2863,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                                               self.host,
                                               num_instances,
                                               time.time() - start_time))
+            self._audit_ran_for_period = (begin, end)
 
     @manager.periodic_task
     def _poll_bandwidth_usage(self, context):
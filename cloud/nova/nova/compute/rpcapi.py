@@ -18,14 +18,60 @@
 Client side of the compute RPC API.
 """
 
+from eventlet import greenpool
+
 from nova import config
 from nova import exception
 from nova import flags
+from nova.openstack.common import cfg
 from nova.openstack.common import jsonutils
+from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
 import nova.openstack.common.rpc.proxy
 
+rpcapi_opts = [
+    cfg.IntOpt('compute_rpc_cast_pool_size',
+               default=0,
+               help='Number of greenthreads used to send casts to compute '
+                    'hosts in the background. Casts are sent from the '
+                    'calling greenthread when set to 0. With more than one '
+                    'greenthread, casts may reach a host out of order.'),
+]
+
 CONF = config.CONF
+CONF.register_opts(rpcapi_opts)
+
+LOG = logging.getLogger(__name__)
+
+_simple_types = (basestring, int, long, float, bool, type(None))
+
+
+def _is_primitive(value):
+    """Check if value is made only of dicts, lists and simple types."""
+    if isinstance(value, _simple_types):
+        return True
+    if type(value) is dict:
+        for k, v in value.iteritems():
+            if not isinstance(k, basestring) or not _is_primitive(v):
+                return False
+        return True
+    if type(value) is list:
+        for v in value:
+            if not _is_primitive(v):
+                return False
+        return True
+    return False
+
+
+def _to_primitive(obj):
+    """Return jsonutils.to_primitive(obj).
+
+    Dicts and lists that are already primitive, such as an instance that
+    arrived over rpc, are returned as they are.
+    """
+    if type(obj) in (dict, list) and _is_primitive(obj):
+        return obj
+    return jsonutils.to_primitive(obj)
 
 
 def _compute_topic(topic, ctxt, host, instance):
@@ -49,82 +95,85 @@ def _compute_topic(topic, ctxt, host, instance):
     return rpc.queue_get_for(ctxt, topic, host)
 
 
+# Retired 1.x versions of the compute rpc API, kept for reference:
+#
+#   1.0 - Initial version.
+#   1.1 - Adds get_host_uptime()
+#   1.2 - Adds check_can_live_migrate_[destination|source]
+#   1.3 - Adds change_instance_metadata()
+#   1.4 - Remove instance_uuid, add instance argument to reboot_instance()
+#   1.5 - Remove instance_uuid, add instance argument to pause_instance(),
+#         unpause_instance()
+#   1.6 - Remove instance_uuid, add instance argument to suspend_instance()
+#   1.7 - Remove instance_uuid, add instance argument to
+#         get_console_output()
+#   1.8 - Remove instance_uuid, add instance argument to
+#         add_fixed_ip_to_instance()
+#   1.9 - Remove instance_uuid, add instance argument to attach_volume()
+#   1.10 - Remove instance_id, add instance argument to
+#          check_can_live_migrate_destination()
+#   1.11 - Remove instance_id, add instance argument to
+#          check_can_live_migrate_source()
+#   1.12 - Remove instance_uuid, add instance argument to confirm_resize()
+#   1.13 - Remove instance_uuid, add instance argument to detach_volume()
+#   1.14 - Remove instance_uuid, add instance argument to finish_resize()
+#   1.15 - Remove instance_uuid, add instance argument to
+#          finish_revert_resize()
+#   1.16 - Remove instance_uuid, add instance argument to get_diagnostics()
+#   1.17 - Remove instance_uuid, add instance argument to get_vnc_console()
+#   1.18 - Remove instance_uuid, add instance argument to inject_file()
+#   1.19 - Remove instance_uuid, add instance argument to
+#          inject_network_info()
+#   1.20 - Remove instance_id, add instance argument to
+#          post_live_migration_at_destination()
+#   1.21 - Remove instance_uuid, add instance argument to
+#          power_off_instance() and stop_instance()
+#   1.22 - Remove instance_uuid, add instance argument to
+#          power_on_instance() and start_instance()
+#   1.23 - Remove instance_id, add instance argument to
+#          pre_live_migration()
+#   1.24 - Remove instance_uuid, add instance argument to
+#          rebuild_instance()
+#   1.25 - Remove instance_uuid, add instance argument to
+#          remove_fixed_ip_from_instance()
+#   1.26 - Remove instance_id, add instance argument to
+#          remove_volume_connection()
+#   1.27 - Remove instance_uuid, add instance argument to
+#          rescue_instance()
+#   1.28 - Remove instance_uuid, add instance argument to reset_network()
+#   1.29 - Remove instance_uuid, add instance argument to resize_instance()
+#   1.30 - Remove instance_uuid, add instance argument to resume_instance()
+#   1.31 - Remove instance_uuid, add instance argument to revert_resize()
+#   1.32 - Remove instance_id, add instance argument to
+#          rollback_live_migration_at_destination()
+#   1.33 - Remove instance_uuid, add instance argument to
+#          set_admin_password()
+#   1.34 - Remove instance_uuid, add instance argument to
+#          snapshot_instance()
+#   1.35 - Remove instance_uuid, add instance argument to
+#          unrescue_instance()
+#   1.36 - Remove instance_uuid, add instance argument to
+#          change_instance_metadata()
+#   1.37 - Remove instance_uuid, add instance argument to
+#          terminate_instance()
+#   1.38 - Changes to prep_resize():
+#           - remove instance_uuid, add instance
+#           - remove instance_type_id, add instance_type
+#           - remove topic, it was unused
+#   1.39 - Remove instance_uuid, add instance argument to run_instance()
+#   1.40 - Remove instance_id, add instance argument to live_migration()
+#   1.41 - Adds refresh_instance_security_rules()
+#   1.42 - Add reservations arg to prep_resize(), resize_instance(),
+#          finish_resize(), confirm_resize(), revert_resize() and
+#          finish_revert_resize()
+#   1.43 - Add migrate_data to live_migration()
+#   1.44 - Adds reserve_block_device_name()
 class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     '''Client side of the compute rpc API.
 
     API version history:
 
-        1.0 - Initial version.
-        1.1 - Adds get_host_uptime()
-        1.2 - Adds check_can_live_migrate_[destination|source]
-        1.3 - Adds change_instance_metadata()
-        1.4 - Remove instance_uuid, add instance argument to reboot_instance()
-        1.5 - Remove instance_uuid, add instance argument to pause_instance(),
-              unpause_instance()
-        1.6 - Remove instance_uuid, add instance argument to suspend_instance()
-        1.7 - Remove instance_uuid, add instance argument to
-              get_console_output()
-        1.8 - Remove instance_uuid, add instance argument to
-              add_fixed_ip_to_instance()
-        1.9 - Remove instance_uuid, add instance argument to attach_volume()
-        1.10 - Remove instance_id, add instance argument to
-               check_can_live_migrate_destination()
-        1.11 - Remove instance_id, add instance argument to
-               check_can_live_migrate_source()
-        1.12 - Remove instance_uuid, add instance argument to confirm_resize()
-        1.13 - Remove instance_uuid, add instance argument to detach_volume()
-        1.14 - Remove instance_uuid, add instance argument to finish_resize()
-        1.15 - Remove instance_uuid, add instance argument to
-               finish_revert_resize()
-        1.16 - Remove instance_uuid, add instance argument to get_diagnostics()
-        1.17 - Remove instance_uuid, add instance argument to get_vnc_console()
-        1.18 - Remove instance_uuid, add instance argument to inject_file()
-        1.19 - Remove instance_uuid, add instance argument to
-               inject_network_info()
-        1.20 - Remove instance_id, add instance argument to
-               post_live_migration_at_destination()
-        1.21 - Remove instance_uuid, add instance argument to
-               power_off_instance() and stop_instance()
-        1.22 - Remove instance_uuid, add instance argument to
-               power_on_instance() and start_instance()
-        1.23 - Remove instance_id, add instance argument to
-               pre_live_migration()
-        1.24 - Remove instance_uuid, add instance argument to
-               rebuild_instance()
-        1.25 - Remove instance_uuid, add instance argument to
-               remove_fixed_ip_from_instance()
-        1.26 - Remove instance_id, add instance argument to
-               remove_volume_connection()
-        1.27 - Remove instance_uuid, add instance argument to
-               rescue_instance()
-        1.28 - Remove instance_uuid, add instance argument to reset_network()
-        1.29 - Remove instance_uuid, add instance argument to resize_instance()
-        1.30 - Remove instance_uuid, add instance argument to resume_instance()
-        1.31 - Remove instance_uuid, add instance argument to revert_resize()
-        1.32 - Remove instance_id, add instance argument to
-               rollback_live_migration_at_destination()
-        1.33 - Remove instance_uuid, add instance argument to
-               set_admin_password()
-        1.34 - Remove instance_uuid, add instance argument to
-               snapshot_instance()
-        1.35 - Remove instance_uuid, add instance argument to
-               unrescue_instance()
-        1.36 - Remove instance_uuid, add instance argument to
-               change_instance_metadata()
-        1.37 - Remove instance_uuid, add instance argument to
-               terminate_instance()
-        1.38 - Changes to prep_resize():
-                - remove instance_uuid, add instance
-                - remove instance_type_id, add instance_type
-                - remove topic, it was unused
-        1.39 - Remove instance_uuid, add instance argument to run_instance()
-        1.40 - Remove instance_id, add instance argument to live_migration()
-        1.41 - Adds refresh_instance_security_rules()
-        1.42 - Add reservations arg to prep_resize(), resize_instance(),
-               finish_resize(), confirm_resize(), revert_resize() and
-               finish_revert_resize()
-        1.43 - Add migrate_data to live_migration()
-        1.44 - Adds reserve_block_device_name()
+        1.x - Retired, see the comment above this class
 
         2.0 - Remove 1.x backwards compat
         2.1 - Adds orig_sys_metadata to rebuild_instance()
@@ -160,6 +209,42 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         super(ComputeAPI, self).__init__(
                 topic=CONF.compute_topic,
                 default_version=self.BASE_RPC_API_VERSION)
+        self._cast_pool = None
+        if CONF.compute_rpc_cast_pool_size > 0:
+            self._cast_pool = greenpool.GreenPool(
+                    CONF.compute_rpc_cast_pool_size)
+
+    def _background_cast(self, ctxt, topic, msg):
+        try:
+            rpc.cast(ctxt, topic, msg)
+        except Exception:
+            LOG.exception(_('Failed to cast %(method)s to %(topic)s'),
+                          {'method': msg['method'], 'topic': topic})
+
+    def cast(self, ctxt, msg, topic=None, version=None):
+        if self._cast_pool is None:
+            return super(ComputeAPI, self).cast(ctxt, msg, topic=topic,
+                                                version=version)
+        self._set_version(msg, version)
+        # NOTE: callers may change the objects referenced by the message
+        # before it is sent, so hold on to a primitive copy of it.
+        msg = jsonutils.to_primitive(msg)
+        # NOTE: spawn_n blocks once every greenthread in the pool is busy,
+        # which keeps a slow broker from queueing casts forever.
+        self._cast_pool.spawn_n(self._background_cast, ctxt,
+                                self._get_topic(topic), msg)
+
+    def _cast_instance(self, ctxt, method, instance, version=None, **kwargs):
+        '''Cast a method to the host running an instance.
+
+        The message carries the instance and any other keyword arguments.
+        '''
+        # NOTE: kwargs is already a new dict, so use it as the message args
+        # directly instead of copying it again through make_msg().
+        kwargs['instance'] = _to_primitive(instance)
+        self.cast(ctxt, {'method': method, 'args': kwargs},
+                topic=_compute_topic(self.topic, ctxt, None, instance),
+                version=version)
 
     def add_aggregate_host(self, ctxt, aggregate, host_param, host,
                            slave_info=None):
@@ -172,7 +257,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         :param host: This is the host to send the message to.
         '''
 
-        aggregate_p = jsonutils.to_primitive(aggregate)
+        aggregate_p = _to_primitive(aggregate)
         self.cast(ctxt, self.make_msg('add_aggregate_host',
                 aggregate=aggregate_p, host=host_param,
                 slave_info=slave_info),
@@ -180,27 +265,20 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.14')
 
     def add_fixed_ip_to_instance(self, ctxt, instance, network_id):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('add_fixed_ip_to_instance',
-                instance=instance_p, network_id=network_id),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'add_fixed_ip_to_instance', instance,
+                network_id=network_id)
 
     def attach_volume(self, ctxt, instance, volume_id, mountpoint):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('attach_volume',
-                instance=instance_p, volume_id=volume_id,
-                mountpoint=mountpoint),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'attach_volume', instance,
+                volume_id=volume_id, mountpoint=mountpoint)
 
     def change_instance_metadata(self, ctxt, instance, diff):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('change_instance_metadata',
-                  instance=instance_p, diff=diff),
-                  topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'change_instance_metadata', instance,
+                diff=diff)
 
     def check_can_live_migrate_destination(self, ctxt, instance, destination,
                                            block_migration, disk_over_commit):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         return self.call(ctxt,
                          self.make_msg('check_can_live_migrate_destination',
                                        instance=instance_p,
@@ -210,7 +288,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                                               ctxt, destination, None))
 
     def check_can_live_migrate_source(self, ctxt, instance, dest_check_data):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         self.call(ctxt, self.make_msg('check_can_live_migrate_source',
                            instance=instance_p,
                            dest_check_data=dest_check_data),
@@ -219,8 +297,8 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     def confirm_resize(self, ctxt, instance, migration, host,
             reservations=None, cast=True):
         rpc_method = self.cast if cast else self.call
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration)
+        instance_p = _to_primitive(instance)
+        migration_p = _to_primitive(migration)
         return rpc_method(ctxt, self.make_msg('confirm_resize',
                 instance=instance_p, migration=migration_p,
                 reservations=reservations),
@@ -228,15 +306,13 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.7')
 
     def detach_volume(self, ctxt, instance, volume_id):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('detach_volume',
-                instance=instance_p, volume_id=volume_id),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'detach_volume', instance,
+                volume_id=volume_id)
 
     def finish_resize(self, ctxt, instance, migration, image, disk_info,
             host, reservations=None):
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration)
+        instance_p = _to_primitive(instance)
+        migration_p = _to_primitive(migration)
         self.cast(ctxt, self.make_msg('finish_resize',
                 instance=instance_p, migration=migration_p,
                 image=image, disk_info=disk_info, reservations=reservations),
@@ -245,8 +321,8 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
 
     def finish_revert_resize(self, ctxt, instance, migration, host,
                              reservations=None):
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration)
+        instance_p = _to_primitive(instance)
+        migration_p = _to_primitive(migration)
         self.cast(ctxt, self.make_msg('finish_revert_resize',
                 instance=instance_p, migration=migration_p,
                 reservations=reservations),
@@ -254,7 +330,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.13')
 
     def get_console_output(self, ctxt, instance, tail_length):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         return self.call(ctxt, self.make_msg('get_console_output',
                 instance=instance_p, tail_length=tail_length),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
@@ -269,13 +345,13 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, host, None))
 
     def get_diagnostics(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         return self.call(ctxt, self.make_msg('get_diagnostics',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def get_vnc_console(self, ctxt, instance, console_type):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         return self.call(ctxt, self.make_msg('get_vnc_console',
                 instance=instance_p, console_type=console_type),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
@@ -299,55 +375,40 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 action=action), topic)
 
     def inject_file(self, ctxt, instance, path, file_contents):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('inject_file',
-                instance=instance_p, path=path,
-                file_contents=file_contents),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'inject_file', instance, path=path,
+                file_contents=file_contents)
 
     def inject_network_info(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('inject_network_info',
-                instance=instance_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'inject_network_info', instance)
 
     def live_migration(self, ctxt, instance, dest, block_migration, host,
                        migrate_data=None):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         self.cast(ctxt, self.make_msg('live_migration', instance=instance_p,
                 dest=dest, block_migration=block_migration,
                 migrate_data=migrate_data),
                 topic=_compute_topic(self.topic, ctxt, host, None))
 
     def pause_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('pause_instance',
-                instance=instance_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'pause_instance', instance)
 
     def post_live_migration_at_destination(self, ctxt, instance,
             block_migration, host):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         return self.call(ctxt,
                 self.make_msg('post_live_migration_at_destination',
                 instance=instance_p, block_migration=block_migration),
                 _compute_topic(self.topic, ctxt, host, None))
 
     def power_off_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('power_off_instance',
-                instance=instance_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'power_off_instance', instance)
 
     def power_on_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('power_on_instance',
-                instance=instance_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'power_on_instance', instance)
 
     def pre_live_migration(self, ctxt, instance, block_migration, disk,
             host):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         return self.call(ctxt, self.make_msg('pre_live_migration',
                 instance=instance_p, block_migration=block_migration,
                 disk=disk), _compute_topic(self.topic, ctxt, host, None))
@@ -355,8 +416,8 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     def prep_resize(self, ctxt, image, instance, instance_type, host,
                     reservations=None, request_spec=None,
                     filter_properties=None):
-        instance_p = jsonutils.to_primitive(instance)
-        instance_type_p = jsonutils.to_primitive(instance_type)
+        instance_p = _to_primitive(instance)
+        instance_type_p = _to_primitive(instance_type)
         self.cast(ctxt, self.make_msg('prep_resize',
                 instance=instance_p, instance_type=instance_type_p,
                 image=image, reservations=reservations,
@@ -367,25 +428,16 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
 
     def reboot_instance(self, ctxt, instance,
                         block_device_info, network_info, reboot_type):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('reboot_instance',
-                instance=instance_p,
-                block_device_info=block_device_info,
-                network_info=network_info,
-                reboot_type=reboot_type),
-                topic=_compute_topic(self.topic, ctxt, None, instance),
-                version='2.5')
+        self._cast_instance(ctxt, 'reboot_instance', instance,
+                block_device_info=block_device_info, network_info=network_info,
+                reboot_type=reboot_type, version='2.5')
 
     def rebuild_instance(self, ctxt, instance, new_pass, injected_files,
             image_ref, orig_image_ref, orig_sys_metadata):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('rebuild_instance',
-                instance=instance_p, new_pass=new_pass,
-                injected_files=injected_files, image_ref=image_ref,
-                orig_image_ref=orig_image_ref,
-                orig_sys_metadata=orig_sys_metadata),
-                topic=_compute_topic(self.topic, ctxt, None, instance),
-                version='2.1')
+        self._cast_instance(ctxt, 'rebuild_instance', instance,
+                new_pass=new_pass, injected_files=injected_files,
+                image_ref=image_ref, orig_image_ref=orig_image_ref,
+                orig_sys_metadata=orig_sys_metadata, version='2.1')
 
     def refresh_provider_fw_rules(self, ctxt, host):
         self.cast(ctxt, self.make_msg('refresh_provider_fw_rules'),
@@ -402,7 +454,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         :param host: This is the host to send the message to.
         '''
 
-        aggregate_p = jsonutils.to_primitive(aggregate)
+        aggregate_p = _to_primitive(aggregate)
         self.cast(ctxt, self.make_msg('remove_aggregate_host',
                 aggregate=aggregate_p, host=host_param,
                 slave_info=slave_info),
@@ -410,52 +462,36 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.15')
 
     def remove_fixed_ip_from_instance(self, ctxt, instance, address):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('remove_fixed_ip_from_instance',
-                instance=instance_p, address=address),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'remove_fixed_ip_from_instance', instance,
+                address=address)
 
     def remove_volume_connection(self, ctxt, instance, volume_id, host):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         return self.call(ctxt, self.make_msg('remove_volume_connection',
                 instance=instance_p, volume_id=volume_id),
                 topic=_compute_topic(self.topic, ctxt, host, None))
 
     def rescue_instance(self, ctxt, instance, rescue_password):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('rescue_instance',
-                instance=instance_p,
-                rescue_password=rescue_password),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'rescue_instance', instance,
+                rescue_password=rescue_password)
 
     def reset_network(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('reset_network',
-                instance=instance_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'reset_network', instance)
 
     def resize_instance(self, ctxt, instance, migration, image, instance_type,
                         reservations=None):
-        topic = _compute_topic(self.topic, ctxt, None, instance)
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration)
-        instance_type_p = jsonutils.to_primitive(instance_type)
-        self.cast(ctxt, self.make_msg('resize_instance',
-                instance=instance_p, migration=migration_p,
-                image=image, reservations=reservations,
-                instance_type=instance_type_p), topic,
-                version='2.16')
+        self._cast_instance(ctxt, 'resize_instance', instance,
+                migration=_to_primitive(migration), image=image,
+                reservations=reservations,
+                instance_type=_to_primitive(instance_type), version='2.16')
 
     def resume_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('resume_instance',
-                instance=instance_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'resume_instance', instance)
 
     def revert_resize(self, ctxt, instance, migration, host,
                       reservations=None):
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration)
+        instance_p = _to_primitive(instance)
+        migration_p = _to_primitive(migration)
         self.cast(ctxt, self.make_msg('revert_resize',
                 instance=instance_p, migration=migration_p,
                 reservations=reservations),
@@ -463,7 +499,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.12')
 
     def rollback_live_migration_at_destination(self, ctxt, instance, host):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         self.cast(ctxt, self.make_msg('rollback_live_migration_at_destination',
             instance=instance_p),
             topic=_compute_topic(self.topic, ctxt, host, None))
@@ -472,7 +508,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                      filter_properties, requested_networks,
                      injected_files, admin_password,
                      is_first_time):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         self.cast(ctxt, self.make_msg('run_instance', instance=instance_p,
                 request_spec=request_spec, filter_properties=filter_properties,
                 requested_networks=requested_networks,
@@ -481,7 +517,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, host, None))
 
     def set_admin_password(self, ctxt, instance, new_pass):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         return self.call(ctxt, self.make_msg('set_admin_password',
                 instance=instance_p, new_pass=new_pass),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
@@ -496,7 +532,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(ctxt, self.make_msg('get_host_uptime'), topic)
 
     def reserve_block_device_name(self, ctxt, instance, device, volume_id):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         return self.call(ctxt, self.make_msg('reserve_block_device_name',
                 instance=instance_p, device=device, volume_id=volume_id),
                 topic=_compute_topic(self.topic, ctxt, None, instance),
@@ -504,66 +540,41 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
 
     def snapshot_instance(self, ctxt, instance, image_id, image_type,
             backup_type, rotation):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('snapshot_instance',
-                instance=instance_p, image_id=image_id,
-                image_type=image_type, backup_type=backup_type,
-                rotation=rotation),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'snapshot_instance', instance,
+                image_id=image_id, image_type=image_type,
+                backup_type=backup_type, rotation=rotation)
 
     def start_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('start_instance',
-                instance=instance_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'start_instance', instance)
 
     def stop_instance(self, ctxt, instance, cast=True):
         rpc_method = self.cast if cast else self.call
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         return rpc_method(ctxt, self.make_msg('stop_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def suspend_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('suspend_instance',
-                instance=instance_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'suspend_instance', instance)
 
     def terminate_instance(self, ctxt, instance, bdms):
-        instance_p = jsonutils.to_primitive(instance)
-        bdms_p = jsonutils.to_primitive(bdms)
-        self.cast(ctxt, self.make_msg('terminate_instance',
-                instance=instance_p, bdms=bdms_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance),
-                version='2.4')
+        self._cast_instance(ctxt, 'terminate_instance', instance,
+                bdms=_to_primitive(bdms), version='2.4')
 
     def unpause_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('unpause_instance',
-                instance=instance_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'unpause_instance', instance)
 
     def unrescue_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('unrescue_instance',
-                instance=instance_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'unrescue_instance', instance)
 
     def publish_service_capabilities(self, ctxt):
         self.fanout_cast(ctxt, self.make_msg('publish_service_capabilities'))
 
     def soft_delete_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('soft_delete_instance',
-                instance=instance_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'soft_delete_instance', instance)
 
     def restore_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
-        self.cast(ctxt, self.make_msg('restore_instance',
-                instance=instance_p),
-                topic=_compute_topic(self.topic, ctxt, None, instance))
+        self._cast_instance(ctxt, 'restore_instance', instance)
 
 
 class SecurityGroupAPI(nova.openstack.common.rpc.proxy.RpcProxy):
@@ -604,7 +615,7 @@ class SecurityGroupAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, host, None))
 
     def refresh_instance_security_rules(self, ctxt, host, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = _to_primitive(instance)
         self.cast(ctxt, self.make_msg('refresh_instance_security_rules',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, instance['host'],
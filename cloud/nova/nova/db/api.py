@@ -380,6 +380,11 @@ def migration_update(context, id, values):
     return IMPL.migration_update(context, id, values)
 
 
+def migration_bulk_update(context, ids, values):
+    """Update a lot of migrations from the values dictionary."""
+    return IMPL.migration_bulk_update(context, ids, values)
+
+
 def migration_create(context, values):
     """Create a migration record."""
     return IMPL.migration_create(context, values)
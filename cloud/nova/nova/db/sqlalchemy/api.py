@@ -3311,6 +3311,18 @@ def migration_update(context, id, values):
         return migration
 
 
+@require_admin_context
+def migration_bulk_update(context, ids, values):
+    if not ids:
+        return 0
+    session = get_session()
+    with session.begin():
+        return model_query(context, models.Migration, session=session,
+                           read_deleted="yes").\
+                filter(models.Migration.id.in_(ids)).\
+                update(values, synchronize_session=False)
+
+
 @require_admin_context
 def migration_get(context, id, session=None):
     result = model_query(context, models.Migration, session=session,
@@ -77,9 +77,10 @@ class LinuxNetL3(L3Driver):
         if self.initialized:
             return
         LOG.debug("Initializing linux_net L3 driver")
-        linux_net.init_host()
-        linux_net.ensure_metadata_ip()
-        linux_net.metadata_forward()
+        with linux_net.iptables_batch():
+            linux_net.init_host()
+            linux_net.ensure_metadata_ip()
+            linux_net.metadata_forward()
         self.initialized = True
 
     def is_initialized(self):
@@ -20,9 +20,14 @@
 """Implements vlans, bridges, and iptables rules using linux utilities."""
 
 import calendar
+import contextlib
+import errno
 import inspect
 import netaddr
 import os
+import re
+import signal
+import sys
 
 from nova import config
 from nova import db
@@ -98,41 +103,63 @@ CONF.register_opts(linux_net_opts)
 #             (max_chain_name_length - len('-POSTROUTING') == 16)
 def get_binary_name():
     """Grab the name of the binary we're running in."""
-    return os.path.basename(inspect.stack()[-1][1])[:16]
+    # NOTE: the __main__ module is the script being run, which is what the
+    # outermost stack frame points at too, without walking the whole stack.
+    # sys.argv[0] is not used as programs are free to rewrite it.
+    # Interactive interpreters have no __main__ file.
+    path = getattr(sys.modules.get('__main__'), '__file__', None)
+    if not path:
+        path = inspect.stack()[-1][1]
+    return os.path.basename(path)[:16]
 
 binary_name = get_binary_name()
 
 
+# Matches the '$' of words that name one of our wrapped chains.
+_wrap_target_re = re.compile(r'(?<![^ ])\$')
+
+
+def _strip_counts(line):
+    """Strip the leading [packet:byte] counts and whitespace from a line."""
+    if line.startswith('['):
+        line = line[line.index(']') + 1:]
+    return line.strip()
+
+
 class IptablesRule(object):
     """An iptables rule.
 
     You shouldn't need to use this class directly, it's only used by
-    IptablesManager.
+    IptablesManager. Rules are compared and formatted on every apply, so
+    they are treated as immutable and both are worked out up front.
 
     """
 
+    __slots__ = ('chain', 'rule', 'wrap', 'top', '_key', '_str')
+
     def __init__(self, chain, rule, wrap=True, top=False):
         self.chain = chain
         self.rule = rule
         self.wrap = wrap
         self.top = top
+        self._key = (chain, rule, wrap, top)
+
+        if wrap:
+            chain = '%s-%s' % (binary_name, chain)
+        # new rules should have a zero [packet: byte] count
+        self._str = '[0:0] -A %s %s' % (chain, rule)
 
     def __eq__(self, other):
-        return ((self.chain == other.chain) and
-                (self.rule == other.rule) and
-                (self.top == other.top) and
-                (self.wrap == other.wrap))
+        return self._key == other._key
 
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return hash(self._key)
+
     def __str__(self):
-        if self.wrap:
-            chain = '%s-%s' % (binary_name, self.chain)
-        else:
-            chain = self.chain
-        # new rules should have a zero [packet: byte] count
-        return '[0:0] -A %s %s' % (chain, self.rule)
+        return self._str
 
 
 class IptablesTable(object):
@@ -186,19 +213,24 @@ class IptablesTable(object):
         if not wrap:
             self.remove_chains.add(name)
         chain_set.remove(name)
-        if not wrap:
-            self.remove_rules += filter(lambda r: r.chain == name, self.rules)
-        self.rules = filter(lambda r: r.chain != name, self.rules)
 
         if wrap:
             jump_snippet = '-j %s-%s' % (binary_name, name)
         else:
             jump_snippet = '-j %s' % (name,)
 
+        # Drop the chain's own rules and every rule jumping to it in a
+        # single pass over the table.
+        rules = []
+        removed = []
+        for rule in self.rules:
+            if rule.chain == name or jump_snippet in rule.rule:
+                removed.append(rule)
+            else:
+                rules.append(rule)
+        self.rules = rules
         if not wrap:
-            self.remove_rules += filter(lambda r: jump_snippet in r.rule,
-                                        self.rules)
-        self.rules = filter(lambda r: jump_snippet not in r.rule, self.rules)
+            self.remove_rules += removed
 
     def add_rule(self, chain, rule, wrap=True, top=False):
         """Add a rule to the table.
@@ -215,15 +247,11 @@ class IptablesTable(object):
             raise ValueError(_('Unknown chain: %r') % chain)
 
         if '$' in rule:
-            rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
+            prefix = '%s-' % (binary_name,)
+            rule = _wrap_target_re.sub(lambda m: prefix, rule)
 
         self.rules.append(IptablesRule(chain, rule, wrap, top))
 
-    def _wrap_target_chain(self, s):
-        if s.startswith('$'):
-            return '%s-%s' % (binary_name, s[1:])
-        return s
-
     def remove_rule(self, chain, rule, wrap=True, top=False):
         """Remove a rule from a chain.
 
@@ -244,10 +272,8 @@ class IptablesTable(object):
 
     def empty_chain(self, chain, wrap=True):
         """Remove all rules from a chain."""
-        chained_rules = [rule for rule in self.rules
-                              if rule.chain == chain and rule.wrap == wrap]
-        for rule in chained_rules:
-            self.rules.remove(rule)
+        self.rules = [rule for rule in self.rules
+                      if rule.chain != chain or rule.wrap != wrap]
 
 
 class IptablesManager(object):
@@ -284,6 +310,7 @@ class IptablesManager(object):
         self.ipv6 = {'filter': IptablesTable()}
 
         self.iptables_apply_deferred = False
+        self._batch_depth = 0
 
         # Add a nova-filter-top chain. It's intended to be shared
         # among the various nova components. It sits at the very top
@@ -341,6 +368,24 @@ class IptablesManager(object):
         self.iptables_apply_deferred = False
         self._apply()
 
+    @contextlib.contextmanager
+    def batch(self):
+        """Apply the rules changed inside the block once, on the way out.
+
+        Batches may be nested or run from several greenthreads at once;
+        the rules are applied when the last open batch ends.
+
+        """
+        if not self._batch_depth:
+            self.defer_apply_on()
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.defer_apply_off()
+
     def apply(self):
         if self.iptables_apply_deferred:
             return
@@ -360,20 +405,45 @@ class IptablesManager(object):
         if CONF.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
+        # NOTE: save and restore every table we manage in one go rather than
+        # running a save/restore pair per table; iptables-restore only
+        # touches the tables present in its input.
         for cmd, tables in s:
+            all_tables, _err = self.execute('%s-save' % (cmd,), '-c',
+                                            run_as_root=True,
+                                            attempts=5)
+            current_tables = self._split_tables(all_tables.split('\n'))
+            new_filter = []
             for table in tables:
-                current_table, _err = self.execute('%s-save' % (cmd,), '-c',
-                                                   '-t', '%s' % (table,),
-                                                   run_as_root=True,
-                                                   attempts=5)
-                current_lines = current_table.split('\n')
-                new_filter = self._modify_rules(current_lines,
-                                                tables[table])
-                self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
-                             process_input='\n'.join(new_filter),
-                             attempts=5)
+                current_lines = current_tables.get(table,
+                                                   ['*%s' % (table,),
+                                                    'COMMIT'])
+                new_filter += self._modify_rules(current_lines,
+                                                 tables[table])
+            self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
+                         process_input='\n'.join(new_filter),
+                         attempts=5)
         LOG.debug(_("IPTablesManager.apply completed with success"))
 
+    def _split_tables(self, lines):
+        """Split iptables-save output into the lines of each table.
+
+        Each table starts with a '*<table name>' line and ends with a
+        'COMMIT' line. Anything outside a table, such as the comments
+        iptables-save adds, is dropped.
+
+        """
+        tables = {}
+        table_lines = None
+        for line in lines:
+            if line.startswith('*'):
+                table_lines = tables.setdefault(line[1:].strip(), [])
+            if table_lines is not None:
+                table_lines.append(line)
+                if line.strip() == 'COMMIT':
+                    table_lines = None
+        return tables
+
     def _modify_rules(self, current_lines, table, binary=None):
         unwrapped_chains = table.unwrapped_chains
         chains = table.chains
@@ -395,8 +465,16 @@ class IptablesManager(object):
                 if not rule.startswith(':'):
                     break
 
+        # Index the current rules by their text without the [packet:byte]
+        # counts, so top rules can find their duplicates without scanning
+        # every line.
+        current_rules = {}
+        for i, line in enumerate(new_filter):
+            current_rules.setdefault(_strip_counts(line), []).append(i)
+
         our_rules = []
         bot_rules = []
+        dup_indices = set()
         for rule in rules:
             rule_str = str(rule)
             if rule.top:
@@ -408,101 +486,76 @@ class IptablesManager(object):
                 # [packet:byte] counts and replace it with [0:0], so let's
                 # go look for a duplicate, and over-ride our table rule if
                 # found.
-
-                # ignore [packet:byte] counts at beginning of line
-                if rule_str.startswith('['):
-                    rule_str = rule_str.split(']', 1)[1]
-                dup_filter = filter(lambda s: rule_str.strip() in s.strip(),
-                                    new_filter)
-
-                new_filter = filter(lambda s:
-                                    rule_str.strip() not in s.strip(),
-                                    new_filter)
+                dups = current_rules.pop(_strip_counts(rule_str), None)
                 # if no duplicates, use original rule
-                if dup_filter:
+                if dups:
+                    dup_indices.update(dups)
                     # grab the last entry, if there is one
-                    dup = dup_filter[-1]
-                    rule_str = str(dup)
-                else:
-                    rule_str = str(rule)
-                rule_str.strip()
+                    rule_str = new_filter[dups[-1]]
 
                 our_rules += [rule_str]
             else:
                 bot_rules += [rule_str]
 
-        our_rules += bot_rules
+        if dup_indices:
+            new_filter = [line for i, line in enumerate(new_filter)
+                          if i not in dup_indices]
 
-        new_filter[rules_index:rules_index] = our_rules
+        our_chains = [':%s-%s - [0:0]' % (binary_name, name,)
+                      for name in chains]
+        our_chains += [':%s - [0:0]' % (name,) for name in unwrapped_chains]
 
-        new_filter[rules_index:rules_index] = [':%s - [0:0]' % (name,)
-                                               for name in unwrapped_chains]
-        new_filter[rules_index:rules_index] = [':%s-%s - [0:0]' %
-                                               (binary_name, name,)
-                                               for name in chains]
+        new_filter[rules_index:rules_index] = (our_chains + our_rules +
+                                               bot_rules)
 
         seen_lines = set()
+        # Look up the rules to remove by their text without counts, rather than
+        # formatting and comparing every one of them for each line.
+        remove_rule_lines = set(_strip_counts(str(rule))
+                                for rule in remove_rules)
 
-        def _weed_out_duplicates(line):
+        # We filter duplicates, letting the *last* occurrence take
+        # precendence.  We also filter out anything in the "remove"
+        # lists.  Both are done in one pass, walking the lines backwards.
+        kept = []
+        for line in reversed(new_filter):
             # ignore [packet:byte] counts at beginning of lines
-            if line.startswith('['):
-                line = line.split(']', 1)[1]
-            line = line.strip()
-            if line in seen_lines:
-                return False
-            else:
-                seen_lines.add(line)
-                return True
+            stripped = _strip_counts(line)
+            if stripped in seen_lines:
+                continue
+            seen_lines.add(stripped)
 
-        def _weed_out_removes(line):
             # We need to find exact matches here
             if line.startswith(':'):
                 # it's a chain, for example, ":nova-billing - [0:0]"
                 # strip off everything except the chain name
-                line = line.split(':')[1]
-                line = line.split('- [')[0]
-                line = line.strip()
-                for chain in remove_chains:
-                    if chain == line:
-                        remove_chains.remove(chain)
-                        return False
+                chain = line[1:].split('- [', 1)[0].strip()
+                if chain in remove_chains:
+                    remove_chains.remove(chain)
+                    continue
             elif line.startswith('['):
                 # it's a rule
-                # ignore [packet:byte] counts at beginning of lines
-                line = line.split(']', 1)[1]
-                line = line.strip()
-                for rule in remove_rules:
-                    # ignore [packet:byte] counts at beginning of rules
-                    rule_str = str(rule)
-                    rule_str = rule_str.split(' ', 1)[1]
-                    rule_str = rule_str.strip()
-                    if rule_str == line:
-                        remove_rules.remove(rule)
-                        return False
-
-            # Leave it alone
-            return True
+                if stripped in remove_rule_lines:
+                    remove_rule_lines.remove(stripped)
+                    continue
 
-        # We filter duplicates, letting the *last* occurrence take
-        # precendence.  We also filter out anything in the "remove"
-        # lists.
-        new_filter.reverse()
-        new_filter = filter(_weed_out_duplicates, new_filter)
-        new_filter = filter(_weed_out_removes, new_filter)
-        new_filter.reverse()
+            kept.append(line)
+        kept.reverse()
+        new_filter = kept
 
         # flush lists, just in case we didn't find something
         remove_chains.clear()
-        for rule in remove_rules:
-            remove_rules.remove(rule)
+        del remove_rules[:]
 
         return new_filter
 
 
 # NOTE(jkoelker) This is just a nice little stub point since mocking
 #                builtins with mox is a nightmare
-def write_to_file(file, data, mode='w'):
+def write_to_file(file, data, mode='w', perm=None):
     with open(file, mode) as f:
+        if perm is not None:
+            os.fchmod(f.fileno(), perm)
         f.write(data)
 
 
@@ -545,6 +598,11 @@ def add_snat_rule(ip_range):
         iptables_manager.apply()
 
 
+def iptables_batch():
+    """Defer applying iptables changes until the end of the block."""
+    return iptables_manager.batch()
+
+
 def init_host(ip_range=None):
     """Basic networking setup goes here."""
     # NOTE(devcamcar): Cloud public SNAT entries and the default
@@ -552,23 +610,23 @@ def init_host(ip_range=None):
     if not ip_range:
         ip_range = CONF.fixed_range
 
-    add_snat_rule(ip_range)
+    with iptables_manager.batch():
+        add_snat_rule(ip_range)
 
-    iptables_manager.ipv4['nat'].add_rule('POSTROUTING',
-                                          '-s %s -d %s/32 -j ACCEPT' %
-                                          (ip_range, CONF.metadata_host))
+        iptables_manager.ipv4['nat'].add_rule('POSTROUTING',
+                                              '-s %s -d %s/32 -j ACCEPT' %
+                                              (ip_range, CONF.metadata_host))
+
+        for dmz in CONF.dmz_cidr:
+            iptables_manager.ipv4['nat'].add_rule('POSTROUTING',
+                                                  '-s %s -d %s -j ACCEPT' %
+                                                  (ip_range, dmz))
 
-    for dmz in CONF.dmz_cidr:
         iptables_manager.ipv4['nat'].add_rule('POSTROUTING',
-                                              '-s %s -d %s -j ACCEPT' %
-                                              (ip_range, dmz))
-
-    iptables_manager.ipv4['nat'].add_rule('POSTROUTING',
-                                          '-s %(range)s -d %(range)s '
-                                          '-m conntrack ! --ctstate DNAT '
-                                          '-j ACCEPT' %
-                                          {'range': ip_range})
-    iptables_manager.apply()
+                                              '-s %(range)s -d %(range)s '
+                                              '-m conntrack ! --ctstate DNAT '
+                                              '-j ACCEPT' %
+                                              {'range': ip_range})
 
 
 def send_arp_for_ip(ip, device, count):
@@ -658,7 +716,7 @@ def initialize_gateway_device(dev, network_ref):
     new_ip_params = [[full_ip, 'brd', network_ref['broadcast']]]
     old_ip_params = []
     out, err = _execute('ip', 'addr', 'show', 'dev', dev,
-                        'scope', 'global', run_as_root=True)
+                        'scope', 'global')
     for line in out.split('\n'):
         fields = line.split()
         if fields and fields[0] == 'inet':
@@ -668,8 +726,7 @@ def initialize_gateway_device(dev, network_ref):
                 new_ip_params.append(ip_params)
     if not old_ip_params or old_ip_params[0][0] != full_ip:
         old_routes = []
-        result = _execute('ip', 'route', 'show', 'dev', dev,
-                          run_as_root=True)
+        result = _execute('ip', 'route', 'show', 'dev', dev)
         if result:
             out, err = result
             for line in out.split('\n'):
@@ -699,28 +756,25 @@ def initialize_gateway_device(dev, network_ref):
 
 def get_dhcp_leases(context, network_ref):
     """Return a network's hosts config in dnsmasq leasefile format."""
-    hosts = []
     host = None
     if network_ref['multi_host']:
         host = CONF.host
-    for data in db.network_get_associated_fixed_ips(context,
-                                                    network_ref['id'],
-                                                    host=host):
-        hosts.append(_host_lease(data))
-    return '\n'.join(hosts)
+    lease_time = CONF.dhcp_lease_time
+    return '\n'.join(_host_lease(data, lease_time)
+                     for data in db.network_get_associated_fixed_ips(
+                         context, network_ref['id'], host=host))
 
 
 def get_dhcp_hosts(context, network_ref):
     """Get network's hosts config in dhcp-host format."""
-    hosts = []
     host = None
     if network_ref['multi_host']:
         host = CONF.host
-    for data in db.network_get_associated_fixed_ips(context,
-                                                    network_ref['id'],
-                                                    host=host):
-        hosts.append(_host_dhcp(data))
-    return '\n'.join(hosts)
+    dhcp_domain = CONF.dhcp_domain
+    single_gateway = CONF.use_single_default_gateway
+    return '\n'.join(_host_dhcp(data, dhcp_domain, single_gateway)
+                     for data in db.network_get_associated_fixed_ips(
+                         context, network_ref['id'], host=host))
 
 
 def _add_dnsmasq_accept_rules(dev):
@@ -769,13 +823,15 @@ def release_dhcp(dev, address, mac_address):
 
 def update_dhcp(context, dev, network_ref):
     conffile = _dhcp_file(dev, 'conf')
-    write_to_file(conffile, get_dhcp_hosts(context, network_ref))
+    # Make sure dnsmasq can actually read it (it setuid()s to "nobody")
+    write_to_file(conffile, get_dhcp_hosts(context, network_ref), perm=0644)
     restart_dhcp(context, dev, network_ref)
 
 
 def update_dhcp_hostfile_with_text(dev, hosts_text):
     conffile = _dhcp_file(dev, 'conf')
-    write_to_file(conffile, hosts_text)
+    # Make sure dnsmasq can actually read it (it setuid()s to "nobody")
+    write_to_file(conffile, hosts_text, perm=0644)
 
 
 def kill_dhcp(dev):
@@ -783,10 +839,8 @@ def kill_dhcp(dev):
     if pid:
         # Check that the process exists and looks like a dnsmasq process
         conffile = _dhcp_file(dev, 'conf')
-        out, _err = _execute('cat', '/proc/%d/cmdline' % pid,
-                             check_exit_code=False)
-        if conffile.split('/')[-1] in out:
-            _execute('kill', '-9', pid, run_as_root=True)
+        if _cmdline_uses_file(pid, conffile):
+            _kill(pid, signal.SIGKILL, '-9')
         else:
             LOG.debug(_('Pid %d is stale, skip killing dnsmasq'), pid)
 
@@ -808,23 +862,16 @@ def restart_dhcp(context, dev, network_ref):
         # NOTE(vish): this will have serious performance implications if we
         #             are not in multi_host mode.
         optsfile = _dhcp_file(dev, 'opts')
-        write_to_file(optsfile, get_dhcp_opts(context, network_ref))
-        os.chmod(optsfile, 0644)
-
-    # Make sure dnsmasq can actually read it (it setuid()s to "nobody")
-    os.chmod(conffile, 0644)
+        write_to_file(optsfile, get_dhcp_opts(context, network_ref),
+                      perm=0644)
 
     pid = _dnsmasq_pid_for(dev)
 
     # if dnsmasq is already running, then tell it to reload
     if pid:
-        out, _err = _execute('cat', '/proc/%d/cmdline' % pid,
-                             check_exit_code=False)
-        # Using symlinks can cause problems here so just compare the name
-        # of the file itself
-        if conffile.split('/')[-1] in out:
+        if _cmdline_uses_file(pid, conffile):
             try:
-                _execute('kill', '-HUP', pid, run_as_root=True)
+                _kill(pid, signal.SIGHUP, '-HUP')
                 _add_dnsmasq_accept_rules(dev)
                 return
             except Exception as exc:  # pylint: disable=W0703
@@ -847,7 +894,7 @@ def restart_dhcp(context, dev, network_ref):
                          (network_ref['label'],
                           network_ref['dhcp_start'],
                           CONF.dhcp_lease_time),
-           '--dhcp-lease-max=%s' % len(netaddr.IPNetwork(network_ref['cidr'])),
+           '--dhcp-lease-max=%s' % netaddr.IPNetwork(network_ref['cidr']).size,
            '--dhcp-hostsfile=%s' % _dhcp_file(dev, 'conf'),
            '--dhcp-script=%s' % CONF.dhcpbridge,
            '--leasefile-ro']
@@ -878,20 +925,16 @@ interface %s
    };
 };
 """ % (dev, network_ref['cidr_v6'])
-    write_to_file(conffile, conf_str)
-
     # Make sure radvd can actually read it (it setuid()s to "nobody")
-    os.chmod(conffile, 0644)
+    write_to_file(conffile, conf_str, perm=0644)
 
     pid = _ra_pid_for(dev)
 
     # if radvd is already running, then tell it to reload
     if pid:
-        out, _err = _execute('cat', '/proc/%d/cmdline'
-                             % pid, check_exit_code=False)
-        if conffile in out:
+        if conffile in _read_cmdline(pid):
             try:
-                _execute('kill', pid, run_as_root=True)
+                _kill(pid, signal.SIGTERM)
             except Exception as exc:  # pylint: disable=W0703
                 LOG.error(_('killing radvd threw %s'), exc)
         else:
@@ -904,16 +947,17 @@ interface %s
     _execute(*cmd, run_as_root=True)
 
 
-def _host_lease(data):
-    """Return a host string for an address in leasefile format."""
-    if data['instance_updated']:
-        timestamp = data['instance_updated']
-    else:
-        timestamp = data['instance_created']
+def _host_lease(data, lease_time=None):
+    """Return a host string for an address in leasefile format.
 
+    Callers formatting many addresses pass lease_time in so the option
+    is only looked up once."""
+    if lease_time is None:
+        lease_time = CONF.dhcp_lease_time
+    timestamp = data['instance_updated'] or data['instance_created']
     seconds_since_epoch = calendar.timegm(timestamp.utctimetuple())
 
-    return '%d %s %s %s *' % (seconds_since_epoch + CONF.dhcp_lease_time,
+    return '%d %s %s %s *' % (seconds_since_epoch + lease_time,
                               data['vif_address'],
                               data['address'],
                               data['instance_hostname'] or '*')
@@ -923,18 +967,25 @@ def _host_dhcp_network(data):
     return 'NW-%s' % data['vif_id']
 
 
-def _host_dhcp(data):
-    """Return a host string for an address in dhcp-host format."""
-    if CONF.use_single_default_gateway:
-        return '%s,%s.%s,%s,%s' % (data['vif_address'],
-                               data['instance_hostname'],
-                               CONF.dhcp_domain,
-                               data['address'],
-                               'net:' + _host_dhcp_network(data))
+def _host_dhcp(data, dhcp_domain=None, single_gateway=None):
+    """Return a host string for an address in dhcp-host format.
+
+    Like _host_lease, the options can be passed in by callers that
+    format a whole network."""
+    if dhcp_domain is None:
+        dhcp_domain = CONF.dhcp_domain
+    if single_gateway is None:
+        single_gateway = CONF.use_single_default_gateway
+    if single_gateway:
+        return '%s,%s.%s,%s,net:NW-%s' % (data['vif_address'],
+                                          data['instance_hostname'],
+                                          dhcp_domain,
+                                          data['address'],
+                                          data['vif_id'])
     else:
         return '%s,%s.%s,%s' % (data['vif_address'],
                                data['instance_hostname'],
-                               CONF.dhcp_domain,
+                               dhcp_domain,
                                data['address'])
 
 
@@ -954,25 +1005,76 @@ def _execute(*cmd, **kwargs):
 
 def _device_exists(device):
     """Check if ethernet device exists."""
-    (_out, err) = _execute('ip', 'link', 'show', 'dev', device,
-                           check_exit_code=False, run_as_root=True)
-    return not err
+    if CONF.fake_network:
+        # NOTE: fake 'ip link show' output always looked like success
+        return True
+    # Every registered network device shows up in sysfs, which saves
+    # running 'ip link show' as root just to check.
+    return os.path.exists('/sys/class/net/%s' % (device,))
+
+
+def _kill(pid, signum, *kill_args):
+    """Send a signal to a process.
+
+    Signals the process directly when we are allowed to, and otherwise
+    runs kill with kill_args through rootwrap.
+
+    """
+    if not CONF.fake_network:
+        try:
+            os.kill(pid, signum)
+            return
+        except OSError as exc:
+            if exc.errno != errno.EPERM:
+                raise
+    _execute('kill', *(kill_args + (pid,)), run_as_root=True)
+
+
+def _read_cmdline(pid):
+    """Return the arguments of a process, or [] if it isn't running."""
+    try:
+        with open('/proc/%d/cmdline' % pid) as f:
+            return [arg for arg in f.read().split('\0') if arg]
+    except (IOError, OSError):
+        return []
+
+
+def _cmdline_uses_file(pid, path):
+    """Check whether any argument of a process ends with path's name.
+
+    Using symlinks can cause problems here, so just compare the name
+    of the file itself."""
+    name = os.path.basename(path)
+    return any(arg.endswith(name) for arg in _read_cmdline(pid))
+
+
+_network_files = {}
+
+
+def _network_file(name):
+    """Return the absolute path of a file under networks_path.
+
+    The directory is only created the first time a path below it is
+    requested, so repeated lookups while restarting dnsmasq or radvd
+    don't stat it over and over."""
+    key = (CONF.networks_path, name)
+    try:
+        return _network_files[key]
+    except KeyError:
+        fileutils.ensure_tree(CONF.networks_path)
+        path = os.path.abspath('%s/%s' % key)
+        _network_files[key] = path
+        return path
 
 
 def _dhcp_file(dev, kind):
     """Return path to a pid, leases or conf file for a bridge/device."""
-    fileutils.ensure_tree(CONF.networks_path)
-    return os.path.abspath('%s/nova-%s.%s' % (CONF.networks_path,
-                                              dev,
-                                              kind))
+    return _network_file('nova-%s.%s' % (dev, kind))
 
 
 def _ra_file(dev, kind):
     """Return path to a pid or conf file for a bridge/device."""
-    fileutils.ensure_tree(CONF.networks_path)
-    return os.path.abspath('%s/nova-ra-%s.%s' % (CONF.networks_path,
-                                              dev,
-                                              kind))
+    return _network_file('nova-ra-%s.%s' % (dev, kind))
 
 
 def _dnsmasq_pid_for(dev):
@@ -985,12 +1087,11 @@ def _dnsmasq_pid_for(dev):
     """
     pid_file = _dhcp_file(dev, 'pid')
 
-    if os.path.exists(pid_file):
-        try:
-            with open(pid_file, 'r') as f:
-                return int(f.read())
-        except (ValueError, IOError):
-            return None
+    try:
+        with open(pid_file, 'r') as f:
+            return int(f.read())
+    except (ValueError, IOError):
+        return None
 
 
 def _ra_pid_for(dev):
@@ -1003,9 +1104,12 @@ def _ra_pid_for(dev):
     """
     pid_file = _ra_file(dev, 'pid')
 
-    if os.path.exists(pid_file):
+    try:
         with open(pid_file, 'r') as f:
             return int(f.read())
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
 
 
 def _ip_bridge_cmd(action, params, device):
@@ -1028,12 +1132,14 @@ def _create_veth_pair(dev1_name, dev2_name):
             except exception.ProcessExecutionError:
                 LOG.exception("Error clearing stale veth %s" % dev)
 
-    utils.execute('ip', 'link', 'add', dev1_name, 'type', 'veth', 'peer',
-                  'name', dev2_name, run_as_root=True)
+    # NOTE: one 'ip -batch' run creates and sets up both ends. Like the
+    # separate commands it replaces, it stops at the first one that fails.
+    commands = ['link add %s type veth peer name %s' % (dev1_name, dev2_name)]
     for dev in [dev1_name, dev2_name]:
-        utils.execute('ip', 'link', 'set', dev, 'up', run_as_root=True)
-        utils.execute('ip', 'link', 'set', dev, 'promisc', 'on',
-                      run_as_root=True)
+        commands.append('link set %s up' % dev)
+        commands.append('link set %s promisc on' % dev)
+    utils.execute('ip', '-batch', '-', process_input='\n'.join(commands),
+                  run_as_root=True)
 
 
 # Similar to compute virt layers, the Linux network node
@@ -1189,7 +1295,7 @@ class LinuxBridgeInterfaceDriver(LinuxNetInterfaceDriver):
                     _execute('ip', 'route', 'del', *fields,
                              run_as_root=True)
             out, err = _execute('ip', 'addr', 'show', 'dev', interface,
-                                'scope', 'global', run_as_root=True)
+                                'scope', 'global')
             for line in out.split('\n'):
                 fields = line.split()
                 if fields and fields[0] == 'inet':
@@ -1238,21 +1344,19 @@ class LinuxOVSInterfaceDriver(LinuxNetInterfaceDriver):
                      '--', 'set', 'Interface', dev,
                      'external-ids:attached-mac=%s' % mac_address,
                      run_as_root=True)
-            _execute('ip', 'link', 'set', dev, 'address', mac_address,
-                     run_as_root=True)
+            link_args = ['ip', 'link', 'set', dev, 'address', mac_address]
             if CONF.network_device_mtu:
-                _execute('ip', 'link', 'set', dev, 'mtu',
-                         CONF.network_device_mtu, run_as_root=True)
-            _execute('ip', 'link', 'set', dev, 'up', run_as_root=True)
+                link_args += ['mtu', CONF.network_device_mtu]
+            link_args.append('up')
+            _execute(*link_args, run_as_root=True)
             if not gateway:
                 # If we weren't instructed to act as a gateway then add the
                 # appropriate flows to block all non-dhcp traffic.
-                _execute('ovs-ofctl',
-                         'add-flow', bridge, 'priority=1,actions=drop',
-                         run_as_root=True)
-                _execute('ovs-ofctl', 'add-flow', bridge,
+                flows = ['priority=1,actions=drop',
                          'udp,tp_dst=67,dl_dst=%s,priority=2,actions=normal' %
-                         mac_address, run_as_root=True)
+                         mac_address]
+                _execute('ovs-ofctl', 'add-flows', bridge, '-',
+                         process_input='\n'.join(flows), run_as_root=True)
                 # .. and make sure iptbles won't forward it as well.
                 iptables_manager.ipv4['filter'].add_rule('FORWARD',
                         '--in-interface %s -j DROP' % bridge)
@@ -1263,6 +1367,9 @@ class LinuxOVSInterfaceDriver(LinuxNetInterfaceDriver):
                         '--in-interface %s -j ACCEPT' % bridge)
                 iptables_manager.ipv4['filter'].add_rule('FORWARD',
                         '--out-interface %s -j ACCEPT' % bridge)
+            # NOTE: both FORWARD rules go out in a single iptables-restore,
+            # or not at all if the caller is batching.
+            iptables_manager.apply()
 
         return dev
 
@@ -1295,12 +1402,14 @@ class QuantumLinuxBridgeInterfaceDriver(LinuxNetInterfaceDriver):
                     '--in-interface %s -j DROP' % bridge)
             iptables_manager.ipv4['filter'].add_rule('FORWARD',
                     '--out-interface %s -j DROP' % bridge)
+            iptables_manager.apply()
             return bridge
         else:
             iptables_manager.ipv4['filter'].add_rule('FORWARD',
                     '--in-interface %s -j ACCEPT' % bridge)
             iptables_manager.ipv4['filter'].add_rule('FORWARD',
                     '--out-interface %s -j ACCEPT' % bridge)
+            iptables_manager.apply()
 
         QuantumLinuxBridgeInterfaceDriver.create_tap_dev(dev, mac_address)
 
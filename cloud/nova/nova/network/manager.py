@@ -1980,9 +1980,12 @@ class FlatDHCPManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
         """Do any initialization that needs to be run if this is a
         standalone service.
         """
-        self.l3driver.initialize()
-        super(FlatDHCPManager, self).init_host()
-        self.init_host_floating_ips()
+        # NOTE: every network and floating ip set up here adds iptables
+        # rules, so apply them all at once at the end.
+        with self.driver.iptables_batch():
+            self.l3driver.initialize()
+            super(FlatDHCPManager, self).init_host()
+            self.init_host_floating_ips()
 
     def _setup_network_on_host(self, context, network):
         """Sets up network on this host."""
@@ -2047,9 +2050,12 @@ class VlanManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
         standalone service.
         """
 
-        self.l3driver.initialize()
-        NetworkManager.init_host(self)
-        self.init_host_floating_ips()
+        # NOTE: every network and floating ip set up here adds iptables
+        # rules, so apply them all at once at the end.
+        with self.driver.iptables_batch():
+            self.l3driver.initialize()
+            NetworkManager.init_host(self)
+            self.init_host_floating_ips()
 
     def allocate_fixed_ip(self, context, instance_id, network, **kwargs):
         """Gets a fixed ip from the pool."""
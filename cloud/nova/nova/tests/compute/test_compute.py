@@ -2636,6 +2636,50 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(call_info['get_by_uuid'], 3)
         self.assertEqual(call_info['get_nw_info'], 4)
 
+    def test_legacy_nw_info_converts_on_every_call(self):
+        self.stubs.Set(nova.virt.fake.FakeDriver, 'legacy_nwinfo',
+                       lambda *a: True)
+        called = {'legacy': 0}
+
+        class FakeNetworkInfo(network_model.NetworkInfo):
+            def legacy(self):
+                called['legacy'] += 1
+                return []
+
+        network_info = FakeNetworkInfo()
+        first = self.compute._legacy_nw_info(network_info)
+        second = self.compute._legacy_nw_info(network_info)
+        self.assertFalse(first is second)
+        self.assertEqual(called['legacy'], 2)
+
+    def test_instance_usage_audit_skips_completed_period(self):
+        self.flags(instance_usage_audit=True)
+        ctxt = context.get_admin_context()
+        called = {'has_audit_been_run': 0, 'get_active_by_window': 0}
+
+        def fake_has_audit_been_run(context, host):
+            called['has_audit_been_run'] += 1
+            return False
+
+        def fake_instance_get_active_by_window_joined(context, begin, end,
+                                                      host=None):
+            called['get_active_by_window'] += 1
+            return []
+
+        self.stubs.Set(compute_utils, 'has_audit_been_run',
+                fake_has_audit_been_run)
+        self.stubs.Set(db, 'instance_get_active_by_window_joined',
+                fake_instance_get_active_by_window_joined)
+        self.stubs.Set(compute_utils, 'start_instance_usage_audit',
+                lambda *a, **kw: None)
+        self.stubs.Set(compute_utils, 'finish_instance_usage_audit',
+                lambda *a, **kw: None)
+
+        self.compute._instance_usage_audit(ctxt)
+        self.compute._instance_usage_audit(ctxt)
+        self.assertEqual(called['has_audit_been_run'], 1)
+        self.assertEqual(called['get_active_by_window'], 1)
+
     def test_poll_unconfirmed_resizes(self):
         instances = [{'uuid': 'fake_uuid1', 'vm_state': vm_states.RESIZED,
                       'task_state': None},
@@ -2676,9 +2720,9 @@ class ComputeTestCase(BaseTestCase):
             self.assertEqual(dest_compute, CONF.host)
             return migrations
 
-        def fake_migration_update(context, migration_id, values):
+        def fake_migration_bulk_update(context, migration_ids, values):
             for migration in migrations:
-                if migration['id'] == migration_id and 'status' in values:
+                if migration['id'] in migration_ids and 'status' in values:
                     migration['status'] = values['status']
 
         def fake_confirm_resize(context, instance):
@@ -2694,8 +2738,8 @@ class ComputeTestCase(BaseTestCase):
                 fake_instance_get_by_uuid)
         self.stubs.Set(db, 'migration_get_unconfirmed_by_dest_compute',
                 fake_migration_get_unconfirmed_by_dest_compute)
-        self.stubs.Set(db, 'migration_update',
-                fake_migration_update)
+        self.stubs.Set(db, 'migration_bulk_update',
+                fake_migration_bulk_update)
         self.stubs.Set(self.compute.compute_api, 'confirm_resize',
                 fake_confirm_resize)
 
@@ -2712,6 +2756,32 @@ class ComputeTestCase(BaseTestCase):
         for uuid, status in expected_migration_status.iteritems():
             self.assertEqual(status, fetch_instance_migration_status(uuid))
 
+    def test_poll_unconfirmed_resizes_flushes_errors_on_failure(self):
+        migrations = [{'id': 1, 'instance_uuid': 'noexist'},
+                      {'id': 2, 'instance_uuid': 'broken'}]
+        updates = []
+
+        def fake_instance_get_by_uuid(context, instance_uuid):
+            if instance_uuid == 'noexist':
+                raise exception.InstanceNotFound(instance_id=instance_uuid)
+            raise test.TestingException()
+
+        def fake_migration_bulk_update(context, migration_ids, values):
+            updates.append((migration_ids, values))
+
+        self.stubs.Set(db, 'instance_get_by_uuid',
+                fake_instance_get_by_uuid)
+        self.stubs.Set(db, 'migration_get_unconfirmed_by_dest_compute',
+                lambda *args: migrations)
+        self.stubs.Set(db, 'migration_bulk_update',
+                fake_migration_bulk_update)
+
+        self.flags(resize_confirm_window=60)
+        self.assertRaises(test.TestingException,
+                          self.compute._poll_unconfirmed_resizes,
+                          context.get_admin_context())
+        self.assertEqual(updates, [([1], {'status': 'error'})])
+
     def test_instance_build_timeout_disabled(self):
         self.flags(instance_build_timeout=0)
         ctxt = context.get_admin_context()
@@ -22,9 +22,11 @@ from nova.compute import rpcapi as compute_rpcapi
 from nova import config
 from nova import context
 from nova import db
+from nova import exception
 from nova import flags
 from nova.openstack.common import jsonutils
 from nova.openstack.common import rpc
+from nova.openstack.common import timeutils
 from nova import test
 
 CONF = config.CONF
@@ -42,6 +44,38 @@ class ComputeRpcAPITestCase(test.TestCase):
     def test_serialized_instance_has_name(self):
         self.assertTrue('name' in self.fake_instance)
 
+    def test_compute_topic_uses_queue_get_for(self):
+        called = []
+
+        def fake_queue_get_for(context, topic, host):
+            called.append((topic, host))
+            return '%s.%s' % (topic, host)
+
+        self.stubs.Set(rpc, 'queue_get_for', fake_queue_get_for)
+        for i in xrange(2):
+            topic = compute_rpcapi._compute_topic('compute', self.context,
+                                                  None, self.fake_instance)
+            self.assertEqual(topic, 'compute.fake_host')
+        self.assertEqual(called, [('compute', 'fake_host')] * 2)
+
+    def test_compute_topic_requires_host(self):
+        self.assertRaises(exception.NovaException,
+                          compute_rpcapi._compute_topic, 'compute',
+                          self.context, None, None)
+        instance = dict(self.fake_instance, host=None)
+        self.assertRaises(exception.NovaException,
+                          compute_rpcapi._compute_topic, 'compute',
+                          self.context, None, instance)
+
+    def test_to_primitive_reflects_model_changes(self):
+        inst = db.instance_create(self.context, {'host': 'fake_host'})
+        first = compute_rpcapi._to_primitive(inst)
+
+        inst['task_state'] = 'fake_state'
+        second = compute_rpcapi._to_primitive(inst)
+        self.assertEqual(first['task_state'], None)
+        self.assertEqual(second['task_state'], 'fake_state')
+
     def _test_compute_api(self, method, rpc_method, **kwargs):
         ctxt = context.RequestContext('fake_user', 'fake_project')
 
@@ -353,3 +387,28 @@ class ComputeRpcAPITestCase(test.TestCase):
     def test_unrescue_instance(self):
         self._test_compute_api('unrescue_instance', 'cast',
                 instance=self.fake_instance)
+
+    def test_background_casts(self):
+        self.flags(compute_rpc_cast_pool_size=1)
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        rpcapi = compute_rpcapi.ComputeAPI()
+        casts = []
+
+        def fake_cast(context, topic, msg):
+            casts.append((topic, msg['method']))
+
+        self.stubs.Set(rpc, 'cast', fake_cast)
+
+        rpcapi.pause_instance(ctxt, self.fake_instance)
+        rpcapi._cast_pool.waitall()
+        self.assertEqual(casts, [('compute.fake_host', 'pause_instance')])
+
+    def test_to_primitive_skips_primitive_dicts(self):
+        self.assertTrue(
+            compute_rpcapi._to_primitive(self.fake_instance) is
+            self.fake_instance)
+        inst = dict(self.fake_instance, created_at=timeutils.utcnow())
+        primitive = compute_rpcapi._to_primitive(inst)
+        self.assertFalse(primitive is inst)
+        self.assertEqual(primitive['created_at'],
+                         timeutils.strtime(inst['created_at']))
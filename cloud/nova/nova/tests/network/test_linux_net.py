@@ -15,7 +15,10 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import datetime
+import errno
 import os
+import signal
 
 import mox
 
@@ -230,25 +233,21 @@ class LinuxNetworkTestCase(test.TestCase):
         self.stubs.Set(db, 'virtual_interface_get_by_instance', get_vifs)
         self.stubs.Set(db, 'instance_get', get_instance)
         self.stubs.Set(db, 'network_get_associated_fixed_ips', get_associated)
+        self.stubs.Set(linux_net, '_network_files', {})
 
     def test_update_dhcp_for_nw00(self):
         self.flags(use_single_default_gateway=True)
 
         self.mox.StubOutWithMock(self.driver, 'write_to_file')
         self.mox.StubOutWithMock(fileutils, 'ensure_tree')
-        self.mox.StubOutWithMock(os, 'chmod')
 
-        self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg())
-        self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg())
+        self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg(),
+                                  perm=0644)
+        self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg(),
+                                  perm=0644)
         fileutils.ensure_tree(mox.IgnoreArg())
         fileutils.ensure_tree(mox.IgnoreArg())
         fileutils.ensure_tree(mox.IgnoreArg())
-        fileutils.ensure_tree(mox.IgnoreArg())
-        fileutils.ensure_tree(mox.IgnoreArg())
-        fileutils.ensure_tree(mox.IgnoreArg())
-        fileutils.ensure_tree(mox.IgnoreArg())
-        os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
-        os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
 
         self.mox.ReplayAll()
 
@@ -259,19 +258,14 @@ class LinuxNetworkTestCase(test.TestCase):
 
         self.mox.StubOutWithMock(self.driver, 'write_to_file')
         self.mox.StubOutWithMock(fileutils, 'ensure_tree')
-        self.mox.StubOutWithMock(os, 'chmod')
 
-        self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg())
-        self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg())
-        fileutils.ensure_tree(mox.IgnoreArg())
-        fileutils.ensure_tree(mox.IgnoreArg())
-        fileutils.ensure_tree(mox.IgnoreArg())
-        fileutils.ensure_tree(mox.IgnoreArg())
+        self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg(),
+                                  perm=0644)
+        self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg(),
+                                  perm=0644)
         fileutils.ensure_tree(mox.IgnoreArg())
         fileutils.ensure_tree(mox.IgnoreArg())
         fileutils.ensure_tree(mox.IgnoreArg())
-        os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
-        os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
 
         self.mox.ReplayAll()
 
@@ -333,6 +327,18 @@ class LinuxNetworkTestCase(test.TestCase):
         actual = self.driver._host_dhcp(data)
         self.assertEquals(actual, expected)
 
+    def test_host_lease_falls_back_to_created_at(self):
+        self.flags(dhcp_lease_time=120)
+        data = {'vif_address': 'DE:AD:BE:EF:00:00',
+                'address': '192.168.0.100',
+                'instance_hostname': None,
+                'instance_updated': None,
+                'instance_created': datetime.datetime(1970, 1, 1, 0, 1)}
+        expected = '180 DE:AD:BE:EF:00:00 192.168.0.100 * *'
+        self.assertEquals(self.driver._host_lease(data), expected)
+        self.assertEquals(self.driver._host_lease(data, 60),
+                          '120 DE:AD:BE:EF:00:00 192.168.0.100 * *')
+
     def test_linux_bridge_driver_plug(self):
         """Makes sure plug doesn't drop FORWARD by default.
 
@@ -533,3 +539,130 @@ class LinuxNetworkTestCase(test.TestCase):
         self.mox.ReplayAll()
         manager.defer_apply_off()
         self.assertFalse(manager.iptables_apply_deferred)
+
+    def test_dhcp_file_ensures_tree_once(self):
+        self.flags(networks_path='/fake/networks')
+        ensured = []
+        self.stubs.Set(fileutils, 'ensure_tree', ensured.append)
+        for i in xrange(3):
+            self.assertEqual(linux_net._dhcp_file('br0', 'pid'),
+                             '/fake/networks/nova-br0.pid')
+        self.assertEqual(linux_net._ra_file('br0', 'conf'),
+                         '/fake/networks/nova-ra-br0.conf')
+        self.assertEqual(ensured, ['/fake/networks', '/fake/networks'])
+
+    def test_write_to_file_sets_permissions(self):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'hosts')
+            linux_net.write_to_file(path, 'data', perm=0640)
+            self.assertEqual(open(path).read(), 'data')
+            self.assertEqual(os.stat(path).st_mode & 0777, 0640)
+
+    def test_update_dhcp_hostfile_with_text_sets_permissions(self):
+        self.mox.StubOutWithMock(linux_net, 'write_to_file')
+        linux_net.write_to_file(mox.IgnoreArg(), 'hosts', perm=0644)
+        self.mox.ReplayAll()
+        linux_net.update_dhcp_hostfile_with_text('br0', 'hosts')
+
+    def test_pid_for_reads_pid_files(self):
+        with utils.tempdir() as tmpdir:
+            self.flags(networks_path=tmpdir)
+            self.assertEqual(linux_net._dnsmasq_pid_for('br0'), None)
+            self.assertEqual(linux_net._ra_pid_for('br0'), None)
+            linux_net.write_to_file(linux_net._dhcp_file('br0', 'pid'), '12')
+            linux_net.write_to_file(linux_net._ra_file('br0', 'pid'), '34')
+            self.assertEqual(linux_net._dnsmasq_pid_for('br0'), 12)
+            self.assertEqual(linux_net._ra_pid_for('br0'), 34)
+
+    def test_read_cmdline(self):
+        with open('/proc/self/cmdline') as f:
+            expected = f.read().split('\0')[:-1]
+        self.assertEqual(linux_net._read_cmdline(os.getpid()), expected)
+
+    def test_read_cmdline_of_missing_process(self):
+        # there is never a process with pid 0 in /proc
+        self.assertEqual(linux_net._read_cmdline(0), [])
+
+    def test_cmdline_uses_file(self):
+        self.stubs.Set(linux_net, '_read_cmdline',
+                       lambda pid: ['dnsmasq',
+                                    '--dhcp-hostsfile=/a/nova-br10.conf'])
+        self.assertTrue(linux_net._cmdline_uses_file(1, '/b/nova-br10.conf'))
+        self.assertFalse(linux_net._cmdline_uses_file(1, '/a/nova-br1.conf'))
+
+    def test_kill_signals_directly(self):
+        self.flags(fake_network=False)
+        self.mox.StubOutWithMock(os, 'kill')
+        self.mox.StubOutWithMock(linux_net, '_execute')
+        os.kill(1234, signal.SIGHUP)
+        self.mox.ReplayAll()
+        linux_net._kill(1234, signal.SIGHUP, '-HUP')
+
+    def test_kill_falls_back_to_rootwrap(self):
+        self.flags(fake_network=False)
+        self.mox.StubOutWithMock(os, 'kill')
+        self.mox.StubOutWithMock(linux_net, '_execute')
+        os.kill(1234, signal.SIGHUP).AndRaise(OSError(errno.EPERM, 'EPERM'))
+        linux_net._execute('kill', '-HUP', 1234, run_as_root=True)
+        self.mox.ReplayAll()
+        linux_net._kill(1234, signal.SIGHUP, '-HUP')
+
+    def test_device_exists(self):
+        self.flags(fake_network=False)
+        self.assertTrue(linux_net._device_exists('lo'))
+        self.assertFalse(linux_net._device_exists('nova-no-such-dev'))
+
+    def test_create_veth_pair(self):
+        self.stubs.Set(linux_net, '_device_exists', lambda dev: False)
+        self.mox.StubOutWithMock(utils, 'execute')
+        utils.execute('ip', '-batch', '-',
+                      process_input='link add veth0 type veth peer name veth1'
+                                    '\nlink set veth0 up'
+                                    '\nlink set veth0 promisc on'
+                                    '\nlink set veth1 up'
+                                    '\nlink set veth1 promisc on',
+                      run_as_root=True)
+        self.mox.ReplayAll()
+        linux_net._create_veth_pair('veth0', 'veth1')
+
+    def test_ovs_plug_batches_link_and_flows(self):
+        self.flags(network_device_mtu=9000)
+        self.stubs.Set(linux_net, '_device_exists', lambda dev: False)
+        calls = []
+
+        def fake_execute(*args, **kwargs):
+            calls.append((args, kwargs.get('process_input')))
+            return '', ''
+        self.stubs.Set(linux_net, '_execute', fake_execute)
+        applied = []
+        self.stubs.Set(linux_net.iptables_manager, '_apply',
+                       lambda: applied.append(True))
+        driver = linux_net.LinuxOVSInterfaceDriver()
+        dev = driver.plug({'uuid': 'net1'}, 'fake_mac', gateway=False)
+        self.assertEqual(dev, 'gw-net1')
+        self.assertEqual(len(applied), 1)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(calls[0][0][0], 'ovs-vsctl')
+        self.assertEqual(calls[1], (('ip', 'link', 'set', 'gw-net1',
+                                     'address', 'fake_mac', 'mtu', 9000,
+                                     'up'), None))
+        self.assertEqual(calls[2], (('ovs-ofctl', 'add-flows', 'br-int', '-'),
+                                    'priority=1,actions=drop\n'
+                                    'udp,tp_dst=67,dl_dst=fake_mac,'
+                                    'priority=2,actions=normal'))
+
+    def test_initialize_gateway_reads_without_root(self):
+        self.flags(fake_network=False)
+        show_calls = []
+
+        def fake_execute(*args, **kwargs):
+            if args[:3] in (('ip', 'addr', 'show'), ('ip', 'route', 'show')):
+                show_calls.append(kwargs.get('run_as_root', False))
+            return '', ''
+        self.stubs.Set(utils, 'execute', fake_execute)
+        network = {'dhcp_server': '192.168.1.1',
+                   'cidr': '192.168.1.0/24',
+                   'broadcast': '192.168.1.255',
+                   'cidr_v6': '2001:db8::/64'}
+        self.driver.initialize_gateway_device('eth0', network)
+        self.assertEqual(show_calls, [False, False])
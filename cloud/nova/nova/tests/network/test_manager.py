@@ -785,6 +785,24 @@ class VlanNetworkTestCase(test.TestCase):
         self.mox.UnsetStubs()
         self.mox.VerifyAll()
 
+    def test_init_host_defers_iptables_apply(self):
+        iptables_manager = self.network.driver.iptables_manager
+        self.mox.StubOutWithMock(iptables_manager, 'defer_apply_on')
+        self.mox.StubOutWithMock(iptables_manager, 'defer_apply_off')
+        self.mox.StubOutWithMock(self.network.l3driver, 'initialize')
+        self.mox.StubOutWithMock(self.network.db, 'network_get_all_by_host')
+        self.mox.StubOutWithMock(self.network, 'init_host_floating_ips')
+
+        iptables_manager.defer_apply_on()
+        self.network.l3driver.initialize()
+        self.network.db.network_get_all_by_host(mox.IgnoreArg(),
+                                                HOST).AndReturn([])
+        self.network.init_host_floating_ips()
+        iptables_manager.defer_apply_off()
+        self.mox.ReplayAll()
+
+        self.network.init_host()
+
     def test_disassociate_floating_ip(self):
         ctxt = context.RequestContext('testuser', 'testproject',
                                       is_admin=False)
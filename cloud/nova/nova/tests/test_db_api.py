@@ -1082,6 +1082,18 @@ class MigrationTestCase(test.TestCase):
             instance = migration['instance']
             self.assertEqual(migration['instance_uuid'], instance['uuid'])
 
+    def test_migration_bulk_update(self):
+        migrations = db.migration_get_in_progress_by_host(self.ctxt, 'host1')
+        ids = [migration['id'] for migration in migrations]
+        self.assertEqual(3, db.migration_bulk_update(self.ctxt, ids,
+                                                     {'status': 'error'}))
+        for migration_id in ids:
+            migration = db.migration_get(self.ctxt, migration_id)
+            self.assertEqual('error', migration['status'])
+        migrations = db.migration_get_in_progress_by_host(self.ctxt, 'host3')
+        for migration in migrations:
+            self.assertNotEqual('error', migration['status'])
+
 
 class TestIpAllocation(test.TestCase):
 
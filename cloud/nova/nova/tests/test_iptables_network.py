@@ -21,6 +21,25 @@ from nova.network import linux_net
 from nova import test
 
 
+class IptablesRuleTestCase(test.TestCase):
+
+    def test_equal_rules_hash_equal(self):
+        rule = linux_net.IptablesRule('FORWARD', '-j ACCEPT', top=True)
+        same = linux_net.IptablesRule('FORWARD', '-j ACCEPT', top=True)
+        other = linux_net.IptablesRule('FORWARD', '-j ACCEPT')
+        self.assertEqual(rule, same)
+        self.assertEqual(hash(rule), hash(same))
+        self.assertNotEqual(rule, other)
+        self.assertEqual(len(set([rule, same, other])), 2)
+
+    def test_str(self):
+        rule = linux_net.IptablesRule('FORWARD', '-j ACCEPT')
+        self.assertEqual(str(rule), '[0:0] -A %s-FORWARD -j ACCEPT' %
+                                    linux_net.binary_name)
+        rule = linux_net.IptablesRule('FORWARD', '-j ACCEPT', wrap=False)
+        self.assertEqual(str(rule), '[0:0] -A FORWARD -j ACCEPT')
+
+
 class IptablesManagerTestCase(test.TestCase):
 
     binary_name = linux_net.get_binary_name()
@@ -100,6 +119,105 @@ class IptablesManagerTestCase(test.TestCase):
                         '-s 1.2.3.4/5 -j DROP' % self.binary_name
                         not in new_lines)
 
+    def test_top_rules_keep_existing_counts(self):
+        rule = '-A FORWARD -j nova-filter-top'
+        current_lines = [line.replace('[0:0] ' + rule, '[42:1024] ' + rule)
+                         for line in self.sample_filter]
+        new_lines = self.manager._modify_rules(current_lines,
+                                               self.manager.ipv4['filter'])
+        top_lines = [line for line in new_lines if rule in line]
+        self.assertEqual(top_lines,
+                         ['[42:1024] -A FORWARD -j nova-filter-top '])
+
+    def test_remove_chain_cascades(self):
+        table = self.manager.ipv4['filter']
+        table.add_chain('shared', wrap=False)
+        table.add_rule('shared', '-j DROP', wrap=False)
+        table.add_rule('FORWARD', '-j shared', wrap=False)
+        table.add_rule('INPUT', '-s 1.2.3.4/5 -j DROP')
+
+        table.remove_chain('shared', wrap=False)
+        self.assertFalse('shared' in table.unwrapped_chains)
+        self.assertEqual(sorted(str(r) for r in table.remove_rules),
+                         ['[0:0] -A FORWARD -j shared',
+                          '[0:0] -A shared -j DROP'])
+        rules = [str(r) for r in table.rules]
+        self.assertFalse('[0:0] -A FORWARD -j shared' in rules)
+        self.assertTrue('[0:0] -A %s-INPUT -s 1.2.3.4/5 -j DROP' %
+                        self.binary_name in rules)
+
+    def test_remove_unwrapped_rule_with_counts(self):
+        current_lines = self.sample_filter[:-2] + [
+                '[12:345] -A OUTPUT -d 10.0.0.1/32 -j DROP ', 'COMMIT']
+        table = self.manager.ipv4['filter']
+        table.add_rule('OUTPUT', '-d 10.0.0.1/32 -j DROP', wrap=False)
+        table.remove_rule('OUTPUT', '-d 10.0.0.1/32 -j DROP', wrap=False)
+
+        new_lines = self.manager._modify_rules(current_lines, table)
+        self.assertFalse([line for line in new_lines
+                          if '-d 10.0.0.1/32 -j DROP' in line])
+        self.assertEqual(table.remove_rules, [])
+
+    def test_remove_lists_are_flushed(self):
+        table = self.manager.ipv4['filter']
+        for i in xrange(4):
+            rule = '-d 10.0.0.%d/32 -j DROP' % i
+            table.add_rule('OUTPUT', rule, wrap=False)
+            table.remove_rule('OUTPUT', rule, wrap=False)
+        table.add_chain('gone', wrap=False)
+        table.remove_chain('gone', wrap=False)
+
+        self.manager._modify_rules(self.sample_filter, table)
+        self.assertEqual(table.remove_rules, [])
+        self.assertEqual(table.remove_chains, set())
+
+    def test_add_rule_wraps_target_chains(self):
+        table = self.manager.ipv4['filter']
+        table.add_rule('FORWARD', '-m comment --comment a$b -j $local')
+        self.assertEqual(str(table.rules[-1]),
+                         '[0:0] -A %(bn)s-FORWARD -m comment --comment a$b '
+                         '-j %(bn)s-local' % {'bn': self.binary_name})
+
+    def test_empty_chain(self):
+        table = self.manager.ipv4['filter']
+        table.add_rule('FORWARD', '-s 1.2.3.4/5 -j DROP')
+        table.add_rule('FORWARD', '-s 6.7.8.9/10 -j DROP')
+        table.add_rule('FORWARD', '-j nova-filter-top', wrap=False)
+
+        table.empty_chain('FORWARD')
+        self.assertEqual([r for r in table.rules
+                          if r.chain == 'FORWARD' and r.wrap], [])
+        self.assertTrue(linux_net.IptablesRule('FORWARD', '-j nova-filter-top',
+                                               wrap=False) in table.rules)
+
+    def test_batch_applies_once(self):
+        applied = []
+        self.stubs.Set(self.manager, '_apply', lambda: applied.append(1))
+
+        with self.manager.batch():
+            self.manager.apply()
+            with self.manager.batch():
+                self.manager.apply()
+            self.assertEqual(applied, [])
+            self.assertTrue(self.manager.iptables_apply_deferred)
+        self.assertEqual(applied, [1])
+        self.assertFalse(self.manager.iptables_apply_deferred)
+
+    def test_overlapping_batches_apply_once_all_end(self):
+        applied = []
+        self.stubs.Set(self.manager, '_apply', lambda: applied.append(1))
+
+        first = self.manager.batch()
+        second = self.manager.batch()
+        first.__enter__()
+        second.__enter__()
+        first.__exit__(None, None, None)
+        self.manager.apply()
+        self.assertEqual(applied, [])
+        second.__exit__(None, None, None)
+        self.assertEqual(applied, [1])
+        self.assertFalse(self.manager.iptables_apply_deferred)
+
     def test_nat_rules(self):
         current_lines = self.sample_nat
         new_lines = self.manager._modify_rules(current_lines,
@@ -170,3 +288,39 @@ class IptablesManagerTestCase(test.TestCase):
             self.assertTrue('[0:0] -A %s -j %s-%s' %
                             (chain, self.binary_name, chain) in new_lines,
                             "Built-in chain %s not wrapped" % (chain,))
+
+    def test_apply_saves_and_restores_all_tables_at_once(self):
+        self.flags(use_ipv6=False)
+        calls = []
+
+        def fake_execute(*cmd, **kwargs):
+            calls.append(cmd)
+            if cmd == ('iptables-save', '-c'):
+                return '\n'.join(self.sample_filter + self.sample_nat), ''
+            self.assertEqual(cmd, ('iptables-restore', '-c'))
+            lines = kwargs['process_input'].split('\n')
+            self.assertTrue('*filter' in lines)
+            self.assertTrue('*nat' in lines)
+            self.assertEqual(lines.count('COMMIT'), 2)
+            return '', ''
+
+        self.manager.execute = fake_execute
+        self.manager.apply()
+        self.assertEqual(calls, [('iptables-save', '-c'),
+                                 ('iptables-restore', '-c')])
+
+    def test_apply_adds_missing_tables(self):
+        self.flags(use_ipv6=False)
+        restored = []
+
+        def fake_execute(*cmd, **kwargs):
+            if cmd == ('iptables-save', '-c'):
+                return '\n'.join(self.sample_filter), ''
+            restored.extend(kwargs['process_input'].split('\n'))
+            return '', ''
+
+        self.manager.execute = fake_execute
+        self.manager.apply()
+        self.assertTrue('*nat' in restored)
+        self.assertTrue(':%s-POSTROUTING - [0:0]' % self.binary_name
+                        in restored)
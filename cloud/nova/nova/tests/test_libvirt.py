@@ -3359,12 +3359,11 @@ class IptablesFirewallTestCase(test.TestCase):
 #        self.fw.add_instance(instance_ref)
         def fake_iptables_execute(*cmd, **kwargs):
             process_input = kwargs.get('process_input', None)
-            if cmd == ('ip6tables-save', '-c', '-t', 'filter'):
+            if cmd == ('ip6tables-save', '-c'):
                 return '\n'.join(self.in6_filter_rules), None
-            if cmd == ('iptables-save', '-c', '-t', 'filter'):
-                return '\n'.join(self.in_filter_rules), None
-            if cmd == ('iptables-save', '-c', '-t', 'nat'):
-                return '\n'.join(self.in_nat_rules), None
+            if cmd == ('iptables-save', '-c'):
+                return '\n'.join(self.in_filter_rules +
+                                 self.in_nat_rules), None
             if cmd == ('iptables-restore', '-c',):
                 lines = process_input.split('\n')
                 if '*filter' in lines:
@@ -2160,6 +2160,52 @@ class XenAPIAggregateTestCase(stubs.XenAPITestBase):
                                          xenhost_uuid='fake_uuid'))
         self.assertTrue(fake_join_slave.called)
 
+    def test_join_slave_reads_metadata_once(self):
+        """Ensure the pool metadata is only fetched once per operation."""
+        self.stubs.Set(self.conn._pool, "_join_slave",
+                       lambda *args: None)
+        virtapi = self.conn._pool._virtapi
+        real_metadata_get = virtapi.aggregate_metadata_get
+        calls = []
+
+        def fake_metadata_get(context, aggregate_id):
+            calls.append(aggregate_id)
+            return real_metadata_get(context, aggregate_id)
+        self.stubs.Set(virtapi, "aggregate_metadata_get", fake_metadata_get)
+
+        aggregate = self._aggregate_setup(hosts=['host', 'host2'],
+                                          metadata=self.fake_metadata)
+        self.conn._pool.add_to_aggregate(self.context, aggregate, "host2",
+                                         dict(compute_uuid='fake_uuid',
+                                         url='fake_url',
+                                         user='fake_user',
+                                         passwd='fake_pass',
+                                         xenhost_uuid='fake_uuid'))
+        self.assertEqual(calls, [aggregate.id])
+
+    def test_add_to_aggregate_rejects_incomplete_slave_info(self):
+        self.stubs.Set(self.conn._pool, "_get_metadata", self.fail)
+        aggregate = self._aggregate_setup(hosts=['host', 'host2'],
+                                          metadata=self.fake_metadata)
+        self.assertRaises(exception.InvalidAggregateAction,
+                          self.conn._pool.add_to_aggregate,
+                          self.context, aggregate, "host2",
+                          dict(compute_uuid='fake_uuid'))
+
+    def test_create_slave_info_is_built_once(self):
+        calls = []
+
+        def fake_get_this_vm_uuid():
+            calls.append(True)
+            return 'fake_compute_uuid'
+        self.stubs.Set(vm_utils, 'get_this_vm_uuid', fake_get_this_vm_uuid)
+
+        slave_info = self.conn._pool._create_slave_info()
+        self.assertEqual(slave_info['url'], 'http://fake_addr')
+        self.assertEqual(slave_info['compute_uuid'], 'fake_compute_uuid')
+        self.assertEqual(self.conn._pool._create_slave_info(), slave_info)
+        self.assertEqual(len(calls), 1)
+
     def test_add_to_aggregate_first_host(self):
         def fake_pool_set_name_label(self, session, pool_ref, name):
             fake_pool_set_name_label.called = True
@@ -2210,6 +2256,19 @@ class XenAPIAggregateTestCase(stubs.XenAPITestBase):
         self.conn._pool.remove_from_aggregate(self.context, aggregate, "host2")
         self.assertTrue(fake_eject_slave.called)
 
+    def test_eject_slave_calls_plugin(self):
+        calls = []
+
+        def fake_call_plugin(plugin, method, args):
+            calls.append((plugin, method, args))
+        self.stubs.Set(self.conn._pool._session, "call_plugin",
+                       fake_call_plugin)
+
+        self.conn._pool._eject_slave(1, 'fake_compute_uuid', 'fake_host_uuid')
+        self.assertEqual(calls, [('xenhost', 'host_eject',
+                                  {'compute_uuid': 'fake_compute_uuid',
+                                   'host_uuid': 'fake_host_uuid'})])
+
     def test_remove_master_solo(self):
         """Ensure metadata are cleared after removal."""
         def fake_clear_pool(id):
@@ -2362,12 +2421,10 @@ class StubDependencies(object):
     def __init__(self):
         self.compute_rpcapi = MockComputeAPI()
 
-    def _is_hv_pool(self, *_ignore):
-        return True
-
     def _get_metadata(self, *_ignore):
         return {
-            pool_states.KEY: {},
+            pool_states.POOL_FLAG: 'XenAPI',
+            pool_states.KEY: pool_states.ACTIVE,
             'master_compute': 'master'
         }
 
@@ -2404,6 +2461,30 @@ class HypervisorPoolTestCase(test.TestCase):
             "CONTEXT", 98, "slave", "master", "SLAVE_INFO"),
             slave.compute_rpcapi._mock_calls)
 
+    def test_slave_forwards_despite_stale_pool_state(self):
+        slave = ResourcePoolWithStubs()
+        aggregate = Aggregate(id=98, hosts=['master', 'slave'])
+        aggregate.metadetails = dict(slave._get_metadata(),
+                                     **{pool_states.KEY: pool_states.CHANGING})
+        self.stubs.Set(slave, '_get_metadata', self.fail)
+
+        slave.remove_from_aggregate("CONTEXT", aggregate, "slave")
+
+        self.assertIn(
+            (slave.compute_rpcapi.remove_aggregate_host,
+            "CONTEXT", 98, "slave", "master", "SLAVE_INFO"),
+            slave.compute_rpcapi._mock_calls)
+
+    def test_slave_forwards_using_aggregate_metadata(self):
+        slave = ResourcePoolWithStubs()
+        aggregate = Aggregate(id=98, hosts=['master', 'other'])
+        aggregate.metadetails = slave._get_metadata()
+        self.stubs.Set(slave, '_get_metadata', self.fail)
+
+        slave.add_to_aggregate("CONTEXT", aggregate, "slave")
+
+        self.assertEqual(len(slave.compute_rpcapi._mock_calls), 1)
+
 
 class SwapXapiHostTestCase(test.TestCase):
 
@@ -2425,6 +2506,12 @@ class SwapXapiHostTestCase(test.TestCase):
             pool.swap_xapi_host(
                 "http://someserver", 'otherserver'))
 
+    def test_host_in_path(self):
+        self.assertEquals(
+            "http://otherserver:8765/someserver:8765",
+            pool.swap_xapi_host(
+                "http://someserver:8765/someserver:8765", 'otherserver'))
+
 
 class VmUtilsTestCase(test.TestCase):
     """Unit tests for xenapi utils."""
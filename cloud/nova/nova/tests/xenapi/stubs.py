@@ -230,12 +230,11 @@ class FakeSessionForFirewallTests(FakeSessionForVMTests):
             else:
                 output = ''
                 process_input = args.get('process_input', None)
-                if cmd == ['ip6tables-save', '-c', '-t', 'filter']:
+                if cmd == ['ip6tables-save', '-c']:
                     output = '\n'.join(self._in6_filter_rules)
-                if cmd == ['iptables-save', '-c', '-t', 'filter']:
-                    output = '\n'.join(self._in_filter_rules)
-                if cmd == ['iptables-save', '-c', '-t', 'nat']:
-                    output = '\n'.join(self._in_nat_rules)
+                if cmd == ['iptables-save', '-c']:
+                    output = '\n'.join(self._in_filter_rules +
+                                       self._in_nat_rules)
                 if cmd == ['iptables-restore', '-c', ]:
                     lines = process_input.split('\n')
                     if '*filter' in lines:
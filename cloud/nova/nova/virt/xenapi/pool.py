@@ -43,6 +43,18 @@ xenapi_pool_opts = [
 CONF = config.CONF
 CONF.register_opts(xenapi_pool_opts)
 
+# pool states in which a host can't be added or removed, with the reason
+_ADD_INVALID = {pool_states.CHANGING: 'setup in progress',
+                pool_states.DISMISSED: 'aggregate deleted',
+                pool_states.ERROR: 'aggregate in error'}
+_REMOVE_INVALID = {pool_states.CREATED: 'no hosts to remove',
+                   pool_states.CHANGING: 'setup in progress',
+                   pool_states.DISMISSED: 'aggregate deleted'}
+
+# what a slave sends along when asking the master to join or eject it
+_SLAVE_INFO_KEYS = frozenset(['url', 'user', 'passwd', 'compute_uuid',
+                              'xenhost_uuid'])
+
 
 class ResourcePool(object):
     """
@@ -56,15 +68,25 @@ class ResourcePool(object):
         self._host_uuid = host_rec['uuid']
         self._session = session
         self._virtapi = virtapi
+        self._slave_info = None
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
 
-    def _is_hv_pool(self, context, aggregate_id):
-        return pool_states.is_hv_pool(
-            self._virtapi.aggregate_metadata_get(context, aggregate_id))
-
     def _get_metadata(self, context, aggregate_id):
         return self._virtapi.aggregate_metadata_get(context, aggregate_id)
 
+    def _remote_master(self, aggregate, host):
+        """Return the master named by the metadata sent with the aggregate.
+
+        Only a master other than this host and host itself is returned:
+        a slave just forwards the request to it, and the master checks
+        the pool state against fresh metadata, so no lookup is needed.
+        """
+        metadata = getattr(aggregate, 'metadetails', None)
+        if metadata and pool_states.is_hv_pool(metadata):
+            master_compute = metadata.get('master_compute')
+            if master_compute not in (None, CONF.host, host):
+                return master_compute
+
     def undo_aggregate_operation(self, context, op, aggregate_id,
                                   host, set_error):
         """Undo aggregate operation when pool error raised"""
@@ -76,28 +98,45 @@ class ResourcePool(object):
             op(context, aggregate_id, host)
         except Exception:
             LOG.exception(_('Aggregate %(aggregate_id)s: unrecoverable state '
-                            'during operation on %(host)s') % locals())
+                            'during operation on %(host)s'),
+                          {'aggregate_id': aggregate_id, 'host': host})
+
+    def _check_slave_info(self, aggregate, action, slave_info):
+        """Reject incomplete slave info before doing any pool work."""
+        missing = _SLAVE_INFO_KEYS.difference(slave_info)
+        if missing:
+            raise exception.InvalidAggregateAction(
+                    action=action,
+                    aggregate_id=aggregate.id,
+                    reason=_('slave info is missing %s')
+                           % ', '.join(sorted(missing)))
 
     def add_to_aggregate(self, context, aggregate, host, slave_info=None):
         """Add a compute host to an aggregate."""
-        if not self._is_hv_pool(context, aggregate.id):
+        if slave_info is not None:
+            self._check_slave_info(aggregate, 'add host', slave_info)
+        master_compute = self._remote_master(aggregate, host)
+        if master_compute and len(aggregate.hosts) != 1:
+            # send rpc cast to master, asking to add the following
+            # host with specified credentials.
+            self.compute_rpcapi.add_aggregate_host(
+                context, aggregate, host, master_compute,
+                self._create_slave_info())
             return
 
-        invalid = {pool_states.CHANGING: 'setup in progress',
-                   pool_states.DISMISSED: 'aggregate deleted',
-                   pool_states.ERROR: 'aggregate in error'}
+        metadata = self._get_metadata(context, aggregate.id)
+        if not pool_states.is_hv_pool(metadata):
+            return
 
-        if (self._get_metadata(context, aggregate.id)[pool_states.KEY]
-                in invalid.keys()):
+        state = metadata[pool_states.KEY]
+        reason = _ADD_INVALID.get(state)
+        if reason is not None:
             raise exception.InvalidAggregateAction(
                     action='add host',
                     aggregate_id=aggregate.id,
-                    reason=invalid[self._get_metadata(context,
-                            aggregate.id)
-                    [pool_states.KEY]])
+                    reason=reason)
 
-        if (self._get_metadata(context, aggregate.id)[pool_states.KEY]
-                == pool_states.CREATED):
+        if state == pool_states.CREATED:
             self._virtapi.aggregate_metadata_add(context, aggregate.id,
                                                  {pool_states.KEY:
                                                       pool_states.CHANGING})
@@ -113,8 +152,7 @@ class ResourcePool(object):
         else:
             # the pool is already up and running, we need to figure out
             # whether we can serve the request from this host or not.
-            master_compute = self._get_metadata(context,
-                    aggregate.id)['master_compute']
+            master_compute = metadata['master_compute']
             if master_compute == CONF.host and master_compute != host:
                 # this is the master ->  do a pool-join
                 # To this aim, nova compute on the slave has to go down.
@@ -136,26 +174,33 @@ class ResourcePool(object):
 
     def remove_from_aggregate(self, context, aggregate, host, slave_info=None):
         """Remove a compute host from an aggregate."""
+        if slave_info is not None:
+            self._check_slave_info(aggregate, 'remove host', slave_info)
         slave_info = slave_info or dict()
-        if not self._is_hv_pool(context, aggregate.id):
+        master_compute = self._remote_master(aggregate, host)
+        if master_compute:
+            # A master exists -> forward pool-eject request to master
+            self.compute_rpcapi.remove_aggregate_host(
+                context, aggregate.id, host, master_compute,
+                self._create_slave_info())
             return
 
-        invalid = {pool_states.CREATED: 'no hosts to remove',
-                   pool_states.CHANGING: 'setup in progress',
-                   pool_states.DISMISSED: 'aggregate deleted', }
-        if (self._get_metadata(context, aggregate.id)[pool_states.KEY]
-                in invalid.keys()):
+        metadata = self._get_metadata(context, aggregate.id)
+        if not pool_states.is_hv_pool(metadata):
+            return
+
+        state = metadata[pool_states.KEY]
+        reason = _REMOVE_INVALID.get(state)
+        if reason is not None:
             raise exception.InvalidAggregateAction(
                     action='remove host',
                     aggregate_id=aggregate.id,
-                    reason=invalid[self._get_metadata(context,
-                            aggregate.id)[pool_states.KEY]])
+                    reason=reason)
 
-        master_compute = self._get_metadata(context,
-                aggregate.id)['master_compute']
+        master_compute = metadata['master_compute']
         if master_compute == CONF.host and master_compute != host:
             # this is the master -> instruct it to eject a host from the pool
-            host_uuid = self._get_metadata(context, aggregate.id)[host]
+            host_uuid = metadata[host]
             self._eject_slave(aggregate.id,
                               slave_info.get('compute_uuid'), host_uuid)
             self._virtapi.aggregate_metadata_delete(context, aggregate.id,
@@ -172,7 +217,7 @@ class ResourcePool(object):
                                     action='remove_from_aggregate',
                                     reason=_('Unable to eject %(host)s '
                                              'from the pool; pool not empty')
-                                             % locals())
+                                             % {'host': host})
             self._clear_pool(aggregate.id)
             for key in ['master_compute', host]:
                 self._virtapi.aggregate_metadata_delete(context, aggregate.id,
@@ -189,7 +234,7 @@ class ResourcePool(object):
                                            action='remove_from_aggregate',
                                            reason=_('Unable to eject %(host)s '
                                            'from the pool; No master found')
-                                           % locals())
+                                           % {'host': host})
 
     def _join_slave(self, aggregate_id, host, compute_uuid, url, user, passwd):
         """Joins a slave into a XenServer resource pool."""
@@ -204,11 +249,12 @@ class ResourcePool(object):
                     'master_pass': CONF.xenapi_connection_password, }
             self._session.call_plugin('xenhost', 'host_join', args)
         except self._session.XenAPI.Failure as e:
-            LOG.error(_("Pool-Join failed: %(e)s") % locals())
+            LOG.error(_("Pool-Join failed: %(e)s"), {'e': e})
             raise exception.AggregateError(aggregate_id=aggregate_id,
                                            action='add_to_aggregate',
                                            reason=_('Unable to join %(host)s '
-                                                  'in the pool') % locals())
+                                                  'in the pool')
+                                                  % {'host': host})
 
     def _eject_slave(self, aggregate_id, compute_uuid, host_uuid):
         """Eject a slave from a XenServer resource pool."""
@@ -217,13 +263,12 @@ class ResourcePool(object):
             # guest instances, the eject will fail. That's a precaution
             # to deal with the fact that the admin should evacuate the host
             # first. The eject wipes out the host completely.
-            vm_ref = self._session.call_xenapi('VM.get_by_uuid', compute_uuid)
-            self._session.call_xenapi("VM.clean_shutdown", vm_ref)
-
-            host_ref = self._session.call_xenapi('host.get_by_uuid', host_uuid)
-            self._session.call_xenapi("pool.eject", host_ref)
+            # The plugin does all of this in dom0, in a single call.
+            args = {'compute_uuid': compute_uuid,
+                    'host_uuid': host_uuid}
+            self._session.call_plugin('xenhost', 'host_eject', args)
         except self._session.XenAPI.Failure as e:
-            LOG.error(_("Pool-eject failed: %(e)s") % locals())
+            LOG.error(_("Pool-eject failed: %(e)s"), {'e': e})
             raise exception.AggregateError(aggregate_id=aggregate_id,
                                            action='remove_from_aggregate',
                                            reason=str(e.details))
@@ -235,7 +280,7 @@ class ResourcePool(object):
             self._session.call_xenapi("pool.set_name_label",
                                       pool_ref, aggregate_name)
         except self._session.XenAPI.Failure as e:
-            LOG.error(_("Unable to set up pool: %(e)s.") % locals())
+            LOG.error(_("Unable to set up pool: %(e)s."), {'e': e})
             raise exception.AggregateError(aggregate_id=aggregate_id,
                                            action='add_to_aggregate',
                                            reason=str(e.details))
@@ -246,30 +291,34 @@ class ResourcePool(object):
             pool_ref = self._session.call_xenapi('pool.get_all')[0]
             self._session.call_xenapi('pool.set_name_label', pool_ref, '')
         except self._session.XenAPI.Failure as e:
-            LOG.error(_("Pool-set_name_label failed: %(e)s") % locals())
+            LOG.error(_("Pool-set_name_label failed: %(e)s"), {'e': e})
             raise exception.AggregateError(aggregate_id=aggregate_id,
                                            action='remove_from_aggregate',
                                            reason=str(e.details))
 
     def _create_slave_info(self):
         """XenServer specific info needed to join the hypervisor pool"""
-        # replace the address from the xenapi connection url
-        # because this might be 169.254.0.1, i.e. xenapi
-        # NOTE: password in clear is not great, but it'll do for now
-        sender_url = swap_xapi_host(
-            CONF.xenapi_connection_url, self._host_addr)
+        # none of this changes while we are running, so build it once
+        if self._slave_info is None:
+            # replace the address from the xenapi connection url
+            # because this might be 169.254.0.1, i.e. xenapi
+            # NOTE: password in clear is not great, but it'll do for now
+            sender_url = swap_xapi_host(
+                CONF.xenapi_connection_url, self._host_addr)
 
-        return {
-            "url": sender_url,
-            "user": CONF.xenapi_connection_username,
-            "passwd": CONF.xenapi_connection_password,
-            "compute_uuid": vm_utils.get_this_vm_uuid(),
-            "xenhost_uuid": self._host_uuid,
-        }
+            self._slave_info = {
+                "url": sender_url,
+                "user": CONF.xenapi_connection_username,
+                "passwd": CONF.xenapi_connection_password,
+                "compute_uuid": vm_utils.get_this_vm_uuid(),
+                "xenhost_uuid": self._host_uuid,
+            }
+        return self._slave_info
 
 
 def swap_xapi_host(url, host_addr):
     """Replace the XenServer address present in 'url' with 'host_addr'."""
-    temp_url = urlparse.urlparse(url)
-    _netloc, sep, port = temp_url.netloc.partition(':')
-    return url.replace(temp_url.netloc, '%s%s%s' % (host_addr, sep, port))
+    parts = urlparse.urlsplit(url)
+    _netloc, sep, port = parts.netloc.partition(':')
+    return urlparse.urlunsplit(
+        parts._replace(netloc='%s%s%s' % (host_addr, sep, port)))